@@ -0,0 +1,103 @@
+"""
+Микробенчмарк извлечения текста из HTML: прежний путь (два прохода
+BeautifulSoup) против html_to_text на bs4 и selectolax.
+
+    python -m benchmarks.bench_extract [--fixtures benchmarks/fixtures] [--repeat 20] [--synthetic]
+
+Фикстуры — страницы (*.html) в каталоге fixtures. В репозитории лежит
+itmo_wiki_ru.html — статья «Университет ИТМО» в разметке ru.wikipedia.org
+(см. комментарий в начале файла). Другие страницы можно добавить локально:
+    curl -L -o benchmarks/fixtures/itmo_ru.html https://itmo.ru/
+С --synthetic к ним добавляется синтетическая страница в стиле Википедии
+(большая, но с однообразной разметкой; в git не попадает).
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from search_itmo.extract import HTMLParser, html_to_text
+
+
+def legacy_extract(html: str) -> str:
+    # Как было до выделения extract.py: get_text() в fetch_page_content
+    # и повторный разбор уже извлечённого текста в compress_pages_for_itmo
+    text = BeautifulSoup(html, "html.parser").get_text()
+    text = BeautifulSoup(text, "html.parser").get_text()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_synthetic_page(paragraphs: int = 400, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    words = "университет итмо санкт-петербург факультет лаборатория студенты фотоника программирование рейтинг".split()
+    nav = "".join(f'<li><a href="/wiki/{i}">Раздел {i}</a></li>' for i in range(300))
+    body = "".join(
+        f"<p>{' '.join(rnd.choice(words) for _ in range(60))} <a href='#'>ссылка</a> <b>важно</b></p>"
+        f"<table><tr><td>{rnd.randint(1900, 2024)}</td><td>{rnd.choice(words)}</td></tr></table>"
+        for _ in range(paragraphs)
+    )
+    scripts = "".join(f"<script>var x{i} = {{a: {i}}};</script>" for i in range(50))
+    return (
+        f"<html><head><style>body {{color: red}}</style>{scripts}</head><body>"
+        f"<nav><ul>{nav}</ul></nav><main>{body}</main><footer>© ИТМО</footer></body></html>"
+    )
+
+
+def load_fixtures(path: str, synthetic: bool = False) -> Dict[str, str]:
+    os.makedirs(path, exist_ok=True)
+    if synthetic:
+        with open(os.path.join(path, "synthetic_wiki.html"), "w", encoding="utf-8") as f:
+            f.write(make_synthetic_page())
+    names = sorted(name for name in os.listdir(path) if name.endswith(".html"))
+    if not synthetic and "synthetic_wiki.html" in names:
+        names.remove("synthetic_wiki.html")
+    if not names:
+        raise SystemExit(f"No *.html fixtures in {path}")
+    fixtures = {}
+    for name in names:
+        with open(os.path.join(path, name), encoding="utf-8", errors="replace") as f:
+            fixtures[name] = f.read()
+    return fixtures
+
+
+def measure(fn: Callable[[str], str], html: str, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTML-to-text extraction micro-benchmark")
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--synthetic", action="store_true", help="also benchmark a generated Wikipedia-like page")
+    args = parser.parse_args()
+
+    candidates: Dict[str, Callable[[str], str]] = {
+        "legacy (bs4 x2)": legacy_extract,
+        "html_to_text bs4": lambda html: html_to_text(html, parser="bs4"),
+    }
+    if HTMLParser is not None:
+        candidates["html_to_text selectolax"] = lambda html: html_to_text(html, parser="selectolax")
+
+    for name, html in load_fixtures(args.fixtures, args.synthetic).items():
+        print(f"\n{name}: {len(html) / 1024:.0f} KiB")
+        for label, fn in candidates.items():
+            timings = measure(fn, html, args.repeat)
+            chars = len(fn(html))
+            print(
+                f"  {label:<26} median {statistics.median(timings):8.2f} ms"
+                f"  min {min(timings):8.2f} ms  text {chars} chars"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Нагрузочный бенчмарк всего сервиса без внешних зависимостей: приложение
+запускается отдельным процессом против локальных заглушек — YandexGPT
+(LLM_BACKEND=stub), Serpstack и страниц (HTTP-сервер в этом процессе).
+Нагрузка подаётся по открытой модели: запросы стартуют с фиксированной
+частотой независимо от того, успели ли завершиться предыдущие.
+
+    python -m benchmarks.bench_load --rps 20 --duration 30 [--workers 2]
+    python -m benchmarks.bench_load --rps 20 --compare benchmarks/results/<прошлый>.json
+
+Задержки заглушек — логнормальные с заданной медианой (--*-latency, секунды)
+и разбросом --latency-sigma; доля ошибок — --*-error-rate. Итог (p50/p95/p99,
+пропускная способность, доля ошибок, среднее время этапов по /metrics)
+печатается и сохраняется в benchmarks/results/<время>-<коммит>.json.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+from prometheus_client.parser import text_string_to_metric_families
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+WORDS = (
+    "университет итмо санкт-петербург факультет лаборатория студенты фотоника "
+    "программирование рейтинг кампус магистратура чемпионат"
+).split()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_questions(count: int, seed: int = 0) -> List[str]:
+    rnd = random.Random(seed)
+    questions = []
+    for i in range(count):
+        topic = " ".join(rnd.choice(WORDS) for _ in range(5))
+        options = "\n".join(f"{n}. {rnd.randint(1900, 2024)}" for n in range(1, 5))
+        questions.append(f"Вопрос {i}: {topic}?\n{options}")
+    return questions
+
+
+def make_page(n: int, paragraphs: int = 60) -> str:
+    rnd = random.Random(n)
+    body = "".join(f"<p>{' '.join(rnd.choice(WORDS) for _ in range(40))}.</p>" for _ in range(paragraphs))
+    return f"<html><head><title>Страница {n}</title></head><body><main>{body}</main></body></html>"
+
+
+class StubUpstreams:
+    """HTTP-заглушки Serpstack (/serp) и страниц (/page/<n>) с задержками и ошибками."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.pages = {n: make_page(n) for n in range(args.pages)}
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _delay(self, median: float) -> None:
+        if median > 0:
+            await asyncio.sleep(random.lognormvariate(math.log(median), self.args.latency_sigma))
+
+    async def serp(self, request: web.Request) -> web.Response:
+        await self._delay(self.args.search_latency)
+        if random.random() < self.args.search_error_rate:
+            return web.Response(status=503)
+        rnd = random.Random(request.query.get("query", ""))
+        urls = [f"{self.base}/page/{rnd.randrange(len(self.pages))}" for _ in range(5)]
+        return web.json_response({"organic_results": [{"url": url} for url in urls]})
+
+    async def page(self, request: web.Request) -> web.Response:
+        await self._delay(self.args.page_latency)
+        if random.random() < self.args.page_error_rate:
+            return web.Response(status=500)
+        html = self.pages.get(int(request.match_info["n"]))
+        if html is None:
+            return web.Response(status=404)
+        return web.Response(text=html, content_type="text/html")
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/serp", self.serp)
+        app.router.add_get("/page/{n}", self.page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def start_app(args: argparse.Namespace, upstreams: StubUpstreams, workdir: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    metrics_dir = os.path.join(workdir, "metrics")
+    os.makedirs(metrics_dir)
+    env = dict(
+        os.environ,
+        LLM_BACKEND="stub",
+        STUB_LLM_LATENCY=str(args.llm_latency),
+        STUB_LLM_ERROR_RATE=str(args.llm_error_rate),
+        SEARCH_URL=f"{upstreams.base}/serp",
+        SEARCH_API_KEY="bench",
+        PAGE_STORE_PATH=os.path.join(workdir, "pages.sqlite3") if args.page_store else "",
+        ANSWER_CACHE_ENABLED="1" if args.answer_cache else "0",
+        ANSWER_CACHE_SQLITE=os.path.join(workdir, "answers.sqlite3"),
+        SHARED_CACHE_PATH=os.path.join(workdir, "shared.sqlite3") if args.shared_cache else "",
+        LOCAL_INDEX_ENABLED="0",
+        ACCESS_LOG_PATH="",
+        ACCESS_LOG_STDOUT="0",
+        PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+    )
+    cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            async with session.get(f"{url}/readyz") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("App did not start in time")
+
+
+async def scrape_stages(session: aiohttp.ClientSession, url: str) -> Dict[str, Tuple[float, float]]:
+    """(сумма секунд, число замеров) по этапам из itmo_stage_seconds."""
+    async with session.get(f"{url}/metrics") as resp:
+        text = await resp.text()
+    stages: Dict[str, List[float]] = {}
+    for family in text_string_to_metric_families(text):
+        if family.name != "itmo_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                stages.setdefault(stage, [0.0, 0.0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                stages.setdefault(stage, [0.0, 0.0])[1] = sample.value
+    return {stage: (total, count) for stage, (total, count) in stages.items()}
+
+
+async def open_loop(
+    session: aiohttp.ClientSession, url: str, questions: List[str], rps: float, duration: float, timeout: float
+) -> List[Tuple[float, int]]:
+    """Запускает запросы каждые 1/rps секунд в течение duration. Возвращает (задержка, статус)."""
+    results: List[Tuple[float, int]] = []
+
+    async def one(i: int) -> None:
+        started = time.perf_counter()
+        try:
+            async with session.post(
+                f"{url}/api/request",
+                json={"id": i, "query": questions[i % len(questions)]},
+                headers={"X-Request-Timeout": str(timeout)},
+            ) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 0
+        results.append((time.perf_counter() - started, status))
+
+    tasks = []
+    start = time.perf_counter()
+    total = int(rps * duration)
+    for i in range(total):
+        delay = start + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(math.ceil(q * len(values))) - 1, len(values) - 1)]
+
+
+def summarize(results: List[Tuple[float, int]], elapsed: float, stages_before, stages_after) -> dict:
+    latencies = [latency for latency, status in results if status == 200]
+    errors = sum(1 for _, status in results if status != 200)
+    stages = {}
+    for stage, (total, count) in stages_after.items():
+        prev_total, prev_count = stages_before.get(stage, (0.0, 0.0))
+        if count > prev_count:
+            stages[stage] = {
+                "count": int(count - prev_count),
+                "mean_ms": round((total - prev_total) / (count - prev_count) * 1000, 1),
+            }
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "statuses": {str(status): n for status, n in sorted(Counter(s for _, s in results).items())},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "stages": stages,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    summary = report["summary"]
+
+    def row(label: str, value: float, old: Optional[float], unit: str = "") -> None:
+        line = f"  {label:<16} {value:>10}{unit}"
+        if old is not None:
+            delta = (value - old) / old * 100 if old else 0.0
+            line += f"   was {old}{unit} ({delta:+.1f}%)"
+        print(line)
+
+    old = baseline["summary"] if baseline else None
+    print(f"\ncommit {report['commit']}, {summary['requests']} requests, statuses {summary['statuses']}")
+    for q in ("p50", "p95", "p99", "mean"):
+        row(f"latency {q}", summary["latency_ms"][q], old["latency_ms"].get(q) if old else None, " ms")
+    row("throughput", summary["throughput_rps"], old["throughput_rps"] if old else None, " rps")
+    row("error rate", summary["error_rate"], old["error_rate"] if old else None)
+    print("  stages (mean):")
+    for stage, data in sorted(summary["stages"].items(), key=lambda item: -item[1]["mean_ms"]):
+        prev = old["stages"].get(stage, {}).get("mean_ms") if old else None
+        row(f"  {stage}", data["mean_ms"], prev, " ms")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    upstreams = StubUpstreams(args)
+    await upstreams.start()
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    process, url = start_app(args, upstreams, workdir)
+    try:
+        timeout = aiohttp.ClientTimeout(total=args.timeout + 30)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_ready(session, url, process)
+            questions = make_questions(args.questions, args.seed)
+            if args.warmup > 0:
+                await open_loop(session, url, questions, args.rps, args.warmup, args.timeout)
+            stages_before = await scrape_stages(session, url)
+            started = time.perf_counter()
+            results = await open_loop(session, url, questions, args.rps, args.duration, args.timeout)
+            elapsed = time.perf_counter() - started
+            stages_after = await scrape_stages(session, url)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await upstreams.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("compare", "output")}
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "summary": summarize(results, elapsed, stages_before, stages_after),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop load benchmark against local stub upstreams")
+    parser.add_argument("--rps", type=float, default=10, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Warm-up seconds (not measured)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=100, help="Distinct questions to cycle through")
+    parser.add_argument("--pages", type=int, default=50, help="Distinct stub pages")
+    parser.add_argument("--timeout", type=float, default=50, help="X-Request-Timeout, seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--page-error-rate", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal sigma of stub latencies")
+    parser.add_argument("--page-store", action="store_true", help="Keep the page/summary store enabled")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache enabled")
+    parser.add_argument("--shared-cache", action="store_true", help="Keep the shared search/LLM cache enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Время старта воркера: импорт приложения в чистом интерпретаторе, путь от
+запуска uvicorn до ответа 200 на /readyz (порт открывается только после
+startup_event, так что это и есть время до первого обслуженного запроса)
+и длительность шагов прогрева из тела /readyz. Внешние сервисы не нужны:
+модель — заглушка (LLM_BACKEND=stub), соединения при прогреве не открываются.
+
+    python -m benchmarks.bench_startup [--runs 5] [--top 15]
+    python -m benchmarks.bench_startup --compare benchmarks/results/<прошлый>.json
+
+Самые дорогие модули берутся из python -X importtime (суммарное время с
+вложенными импортами). Итог печатается и сохраняется в
+benchmarks/results/startup-<время>-<коммит>.json.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.bench_load import BACKEND_DIR, RESULTS_DIR, free_port, git_commit
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def app_env(workdir: str) -> Dict[str, str]:
+    return dict(
+        os.environ,
+        LLM_BACKEND="stub",
+        WARMUP_URLS="",
+        ACCESS_LOG_PATH="",
+        ACCESS_LOG_STDOUT="0",
+        ANSWER_CACHE_SQLITE=os.path.join(workdir, "answers.sqlite3"),
+        PAGE_STORE_PATH=os.path.join(workdir, "pages.sqlite3"),
+        SHARED_CACHE_PATH=os.path.join(workdir, "shared.sqlite3"),
+    )
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    out = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL, text=True
+    )
+    return float(out.strip().splitlines()[-1])
+
+
+def top_imports(env: Dict[str, str], top: int) -> List[Tuple[str, float]]:
+    """
+    Модули с наибольшим суммарным временем импорта (мс): main и то, что он
+    импортирует напрямую, — глубже время уже учтено в родителе.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package", вложенность — отступом по 2 пробела
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(cumulative_us) / 1000))
+    # Строки идут в порядке завершения импорта: поддерево main — от предыдущей
+    # строки нулевого уровня (site и т.п.) до самой строки main
+    end = next((i for i, row in enumerate(rows) if row[0] == 0 and row[1] == "main"), len(rows) - 1)
+    begin = max((i + 1 for i, row in enumerate(rows[:end]) if row[0] == 0), default=0)
+    app_rows = [(name, ms) for depth, name, ms in rows[begin:end + 1] if depth <= 1]
+    return sorted(app_rows, key=lambda item: -item[1])[:top]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float) -> dict:
+    """Ждёт ответа 200 от /readyz и возвращает его тело."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/readyz", timeout=1) as resp:
+                return json.load(resp)
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("App did not become ready in time")
+
+
+def measure_startup(env: Dict[str, str], timeout: float) -> Tuple[float, Dict[str, float]]:
+    """Секунды от запуска uvicorn до готовности и длительность шагов прогрева."""
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL)
+    try:
+        body = wait_ready(f"http://127.0.0.1:{port}", process, timeout)
+        ready = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return ready, {step: result["seconds"] for step, result in body.get("warmup", {}).items()}
+
+
+def stats(values: List[float]) -> dict:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    old = baseline["summary"] if baseline else None
+    print(f"\ncommit {report['commit']}, {report['params']['runs']} runs (median, min..max)")
+    for key, label in (("import", "import main"), ("readyz", "to /readyz")):
+        data = report["summary"][key]
+        line = f"  {label:<14} {data['median_ms']:>8} ms   ({data['min_ms']}..{data['max_ms']})"
+        if old is not None and key in old:
+            prev = old[key]["median_ms"]
+            delta = (data["median_ms"] - prev) / prev * 100 if prev else 0.0
+            line += f"   was {prev} ms ({delta:+.1f}%)"
+        print(line)
+    print("  warm-up steps (median):")
+    for step, ms in report["summary"]["warmup_ms"].items():
+        print(f"    {step:<40} {ms:>8.1f} ms")
+    print("  slowest imports (cumulative):")
+    for name, ms in report["summary"]["top_imports"]:
+        print(f"    {name:<40} {ms:>8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import and worker startup time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest imports to show")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /readyz")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/startup-<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        env = app_env(workdir)
+        # Первый запуск прогревает кэш байт-кода и файловый кэш ОС
+        measure_import(env)
+        imports = [measure_import(env) for _ in range(args.runs)]
+        startups = [measure_startup(env, args.timeout) for _ in range(args.runs)]
+        slowest = top_imports(env, args.top)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "summary": {
+            "import": stats(imports),
+            "readyz": stats([ready for ready, _ in startups]),
+            "warmup_ms": {
+                step: round(statistics.median(steps.get(step, 0.0) for _, steps in startups) * 1000, 1)
+                for step in startups[0][1]
+            },
+            "top_imports": [[name, round(ms, 1)] for name, ms in slowest],
+        },
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"startup-{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+
+from prometheus_client import multiprocess
+
+# Приложение импортируется один раз в мастере, и воркеры стартуют с уже
+# загруженными модулями. Всё, что нельзя делить между процессами (клиент
+# модели, SQLite-соединения, HTTP-клиент, пул разбора HTML), создаётся
+# лениво в каждом воркере, а прогрев идёт в его startup_event
+preload_app = True
+
+
+def when_ready(server):
+    # Мастер сам метрики не пишет; если при импорте приложения он всё же
+    # создал файлы gauge, они не должны попадать в сумму по воркерам
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def child_exit(server, worker):
+    # Файлы метрик завершившегося воркера больше не учитываются в gauge (livesum).
+    # Без PROMETHEUS_MULTIPROC_DIR (запуск не через start.sh) файлов метрик нет
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,23 +1,33 @@
 import time
+import hmac
+import json
+import math
 import asyncio
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Response, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import HttpUrl
 
 from schemas.request import PredictionRequest, PredictionResponse
-from utils.logger import setup_logger
+from utils.logger import AccessLogMiddleware, access_log
 from fastapi.middleware.cors import CORSMiddleware
 
-from search_itmo.services import (
-    transform_query_for_google,
-    fetch_page_texts,
-    compress_pages_for_itmo,
-    ask_which_variant,
-    ask_explanation, search_serpstack,
-)
+from search_itmo.admission import Overloaded, admission, parse_priority
+from search_itmo.cache import answer_cache
+from search_itmo.semantic_cache import semantic_cache
+from search_itmo.shared_cache import shared_cache
+from search_itmo.config import ADMIN_TOKEN, BATCH_MAX_SIZE
+from search_itmo.deadline import start_request
+from search_itmo.events import format_sse
+from search_itmo.pipeline import get_answer, iter_batch_answers, stream_answer
+from search_itmo.http_client import start_http_client, close_http_client
+from search_itmo.extract import shutdown_extract_pool
+from search_itmo.limiter import LIMITERS, UpstreamUnavailable
+from search_itmo.warmup import is_ready, set_ready, warm_up, warmup_report
+from search_itmo.metrics import INFLIGHT_REQUESTS, REQUESTS, finish_trace, render_metrics, start_trace, timed
 
 app = FastAPI()
-logger = None
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,89 +36,259 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(AccessLogMiddleware, writer=access_log)
 
 
 @app.on_event("startup")
 async def startup_event():
-    global logger
-    logger = await setup_logger()
-
-
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    body = await request.body()
-    await logger.info(f"Incoming request: {request.method} {request.url}\nRequest body: {body.decode()}")
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response_body = b""
-    async for chunk in response.body_iterator:
-        response_body += chunk
-    await logger.info(
-        f"Request completed: {request.method} {request.url}\n"
-        f"Status: {response.status_code}\n"
-        f"Response body: {response_body.decode()}\n"
-        f"Duration: {process_time:.3f}s"
-    )
-    return Response(
-        content=response_body,
-        status_code=response.status_code,
-        headers=dict(response.headers),
-        media_type=response.media_type,
-    )
-
-
-@app.post("/api/request", response_model=PredictionResponse)
-async def predict(body: PredictionRequest):
-    try:
-        # await logger.info(f"Processing prediction request with id: {body.id}, query='{body.query}'")
-
-        # Шаг 1: параллельно:
-        # (a) Получаем гугл-запрос
-        # (b) Проверяем, есть ли multiple-choice
-        tasks = [
-            transform_query_for_google(body.query),
-        ]
-        refined_query, = await asyncio.gather(*tasks)
+    await access_log.start()
+    await start_http_client()
+    # Воркер начинает принимать запросы только после прогрева
+    await warm_up()
 
-        # await logger.info(f"Refined query: {refined_query}")
 
-        # Шаг 2: Идём в Google (через другое api, потому что у этого ограничений больше)
-        links = await search_serpstack(refined_query)
-        # await logger.info(f"Got links: {links}")
+@app.on_event("shutdown")
+async def shutdown_event():
+    set_ready(False)
+    await close_http_client()
+    shutdown_extract_pool()
+    await access_log.stop()
 
-        # Шаг 3: Скачиваем тексты, сжимаем до нужных частей
-        raw_pages = await fetch_page_texts(links)
-        big_context = await compress_pages_for_itmo(raw_pages)
 
+def build_response(request_id: int, result: dict) -> PredictionResponse:
+    # Список источников
+    sources: List[HttpUrl] = []
+    for link in result["sources"]:
+        sources.append(HttpUrl(link))
 
+    return PredictionResponse(
+        id=request_id,
+        answer=result["answer"],
+        reasoning=result["reasoning"],
+        sources=sources,
+        skipped_stages=result.get("skipped_stages", []),
+    )
 
-        # Шаг 5: всегда спрашиваем "пояснение"
-        explanation = await ask_explanation(body.query, big_context)
-
-        chosen_variant = await ask_which_variant(body.query, explanation)
-        # await logger.info(f"chosen_variant = {chosen_variant}")
 
-        # Формируем ответ
-        final_answer = chosen_variant if chosen_variant is not None else None
+@app.post("/api/request", response_model=PredictionResponse)
+async def predict(
+    body: PredictionRequest,
+    x_request_timeout: Optional[float] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    start_trace()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        start_request(x_request_timeout)
+        # await logger.info(f"Processing prediction request with id: {body.id}, query='{body.query}'")
 
-        # Список источников
-        sources: List[HttpUrl] = []
-        for link in links:
-            sources.append(HttpUrl(link))
+        with INFLIGHT_REQUESTS.track_inprogress(), timed("total"):
+            result = await get_answer(body.query, parse_priority(x_priority))
 
-        resp = PredictionResponse(
-            id=body.id,
-            answer=final_answer,
-            reasoning=explanation + "\n Ответ сгенерирован yandexgpt-32k/rc",
-            sources=sources
-        )
+        resp = build_response(body.id, result)
+        outcome = "degraded" if resp.skipped_stages else "ok"
         # await logger.info(f"Final response: {resp}")
         return resp
 
+    except Overloaded as e:
+        outcome = "shed"
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server overloaded: {e}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except UpstreamUnavailable as e:
+        outcome = "rejected"
+        raise HTTPException(
+            status_code=429,
+            detail=f"Upstream overloaded: {e}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
     except ValueError as e:
         # await logger.error(f"Validation error: {str(e)}")
+        outcome = "bad_request"
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # await logger.error(f"Internal error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        REQUESTS.labels(outcome).inc()
+        finish_trace(body.id, time.perf_counter() - started)
+
+
+@app.post("/api/request/stream")
+async def predict_stream(
+    body: PredictionRequest,
+    x_request_timeout: Optional[float] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    """
+    Тот же ответ, что и /api/request, но в виде Server-Sent Events: по мере
+    готовности этапов приходят события query (переформулированный запрос),
+    sources, summary (выжимка страницы), token (кусок пояснения), variant,
+    а последним — result с телом в формате PredictionResponse (или error).
+    Если клиент закрыл соединение, обработка запроса прерывается.
+    """
+
+    async def events():
+        start_trace()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            start_request(x_request_timeout)
+            with INFLIGHT_REQUESTS.track_inprogress(), timed("total"):
+                async for event, data in stream_answer(body.query, parse_priority(x_priority)):
+                    if event == "result":
+                        resp = build_response(body.id, data)
+                        outcome = "degraded" if resp.skipped_stages else "ok"
+                        data = jsonable_encoder(resp)
+                    yield format_sse(event, data)
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Overloaded as e:
+            outcome = "shed"
+            yield format_sse("error", {"status": 503, "detail": f"Server overloaded: {e}", "retry_after": e.retry_after})
+        except UpstreamUnavailable as e:
+            outcome = "rejected"
+            yield format_sse("error", {"status": 429, "detail": f"Upstream overloaded: {e}", "retry_after": e.retry_after})
+        except ValueError as e:
+            outcome = "bad_request"
+            yield format_sse("error", {"status": 400, "detail": str(e)})
+        except Exception:
+            yield format_sse("error", {"status": 500, "detail": "Internal server error"})
+        finally:
+            REQUESTS.labels(outcome).inc()
+            finish_trace(body.id, time.perf_counter() - started)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def batch_item(request_id: int, result) -> dict:
+    # Ошибка одного вопроса не проваливает всю пачку
+    if isinstance(result, Overloaded):
+        REQUESTS.labels("shed").inc()
+        return {"id": request_id, "error": f"Server overloaded: {result}", "retry_after": result.retry_after}
+    if isinstance(result, UpstreamUnavailable):
+        REQUESTS.labels("rejected").inc()
+        return {"id": request_id, "error": f"Upstream overloaded: {result}", "retry_after": result.retry_after}
+    if isinstance(result, ValueError):
+        REQUESTS.labels("bad_request").inc()
+        return {"id": request_id, "error": str(result)}
+    if isinstance(result, Exception):
+        REQUESTS.labels("error").inc()
+        return {"id": request_id, "error": "Internal server error"}
+    try:
+        resp = build_response(request_id, result)
+    except ValueError as e:
+        REQUESTS.labels("bad_request").inc()
+        return {"id": request_id, "error": str(e)}
+    REQUESTS.labels("degraded" if resp.skipped_stages else "ok").inc()
+    return jsonable_encoder(resp)
+
+
+@app.post("/api/batch")
+async def predict_batch(
+    body: List[PredictionRequest],
+    stream: bool = False,
+    x_request_timeout: Optional[float] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    """
+    Пачка вопросов за один HTTP-запрос. Ответ — список в порядке входа:
+    тела PredictionResponse или {"id", "error"} для вопросов с ошибкой.
+    С ?stream=true ответы отдаются построчно (NDJSON) по мере готовности,
+    также в порядке входа. X-Request-Timeout — дедлайн каждого вопроса,
+    X-Priority — класс допуска (по умолчанию batch).
+    """
+    if len(body) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_SIZE} questions")
+
+    async def items():
+        with INFLIGHT_REQUESTS.track_inprogress(), timed("batch"):
+            async for idx, result in iter_batch_answers(
+                [req.query for req in body], x_request_timeout, priority=parse_priority(x_priority, "batch")
+            ):
+                yield batch_item(body[idx].id, result)
+
+    if stream:
+        async def lines():
+            async for item in items():
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    return [item async for item in items()]
+
+
+@app.get("/healthz")
+async def healthz():
+    """Процесс жив и обслуживает event loop."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Воркер прогрет и готов принимать запросы (503 — во время старта и остановки)."""
+    body = {"status": "ready" if is_ready() else "starting", "warmup": warmup_report()}
+    return JSONResponse(body, status_code=200 if is_ready() else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики Prometheus (при PROMETHEUS_MULTIPROC_DIR — сумма по всем воркерам)."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+def check_admin_token(token: Optional[str]) -> None:
+    # Без настроенного токена служебные эндпоинты закрыты: сброс кэшей
+    # с публичного адреса стоил бы повторных вызовов YandexGPT и Serpstack
+    if not ADMIN_TOKEN or token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.get("/api/admin/cache")
+async def cache_stats(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    semantic = semantic_cache.snapshot() if semantic_cache is not None else None
+    shared = shared_cache.snapshot() if shared_cache is not None else None
+    if answer_cache is None:
+        return {"enabled": False, "semantic": semantic, "shared_cache": shared}
+    return {"enabled": True, **answer_cache.snapshot(), "semantic": semantic, "shared_cache": shared}
+
+
+@app.delete("/api/admin/cache")
+async def cache_invalidate(query: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Сбрасывает кэш ответов: один вопрос (?query=...) или целиком.
+    Смысловой кэш при этом очищается целиком (в остальных воркерах — при
+    следующем обращении, по смене поколения кэша ответов). При полном сбросе
+    очищается и общий кэш выдачи и ответов модели, иначе тот же ответ
+    соберётся заново из старых данных.
+    """
+    check_admin_token(x_admin_token)
+    if semantic_cache is not None:
+        semantic_cache.invalidate()
+    if shared_cache is not None and query is None:
+        await shared_cache.clear()
+    if answer_cache is None:
+        return {"enabled": False, "removed": 0}
+    removed = await answer_cache.invalidate(query)
+    if semantic_cache is not None:
+        semantic_cache.sync_generation(answer_cache.generation)
+    return {"enabled": True, "removed": removed}
+
+
+@app.get("/api/admin/limiters")
+async def limiter_stats(x_admin_token: Optional[str] = Header(None)):
+    """Состояние адаптивных лимитов и цепей к внешним сервисам в этом воркере."""
+    check_admin_token(x_admin_token)
+    return {
+        **{name: limiter.snapshot() for name, limiter in LIMITERS.items()},
+        "admission": admission.snapshot(),
+    }
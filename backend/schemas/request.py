@@ -13,3 +13,4 @@ class PredictionResponse(BaseModel):
     answer: Optional[int] = None
     reasoning: str
     sources: List[HttpUrl]
+    skipped_stages: List[str] = []
@@ -7,4 +7,5 @@ class PredictionResponse(BaseModel):
     id: int
     answer: Optional[int] = None
     reasoning: str
-    sources: List[HttpUrl]
\ No newline at end of file
+    sources: List[HttpUrl]
+    skipped_stages: List[str] = []
\ No newline at end of file
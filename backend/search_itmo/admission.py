@@ -0,0 +1,214 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .config import ADMISSION_MAX_ACTIVE, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT, ANSWER_RESERVE
+from .deadline import stage_timeout
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Классы запросов (заголовок X-Priority): меньшее число проходит раньше
+PRIORITIES: Dict[str, int] = {"interactive": 0, "normal": 1, "batch": 2}
+
+
+class Overloaded(Exception):
+    """Запрос не допущен к обработке: воркер перегружен, ответить вовремя он не успеет."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_priority(value: Optional[str], default: str = "normal") -> str:
+    """Класс из заголовка X-Priority; неизвестные значения — класс по умолчанию."""
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else default
+
+
+class Ticket:
+    """
+    Место одного вычисления в очереди допуска. Одно вычисление может ждать
+    несколько запросов (объединение одинаковых вопросов), поэтому класс
+    билета повышается до самого важного из них (AdmissionController.promote).
+    """
+
+    __slots__ = ("priority", "item")
+
+    def __init__(self, priority: str = "normal"):
+        self.priority = priority
+        # Запись в очереди, пока билет ждёт: (класс, порядковый номер, имя класса, future)
+        self.item: Optional[Tuple[int, int, str, asyncio.Future]] = None
+
+
+class AdmissionController:
+    """
+    Допуск запросов к конвейеру: одновременно считаются не больше max_active
+    вопросов, остальные ждут в очереди по приоритету (внутри класса — по
+    порядку прихода). Лишняя работа отсекается сразу, а не после таймаута:
+
+    - если по среднему времени обработки ожидание в очереди превысит
+      max_wait или остаток дедлайна запроса, запрос отклоняется сразу
+      (класс batch ограничен только дедлайном: пачку и так ограничивает
+      BATCH_CONCURRENCY, а ждать ей не страшно);
+    - при полной очереди новый запрос вытесняет самый поздний запрос более
+      низкого класса, а если таких нет — отклоняется сам;
+    - запрос, так и не дождавшийся места за отведённое время, отклоняется.
+
+    Отклонённый запрос получает Overloaded со сроком, через который стоит
+    повторить (оценка ожидания очереди). Предельное ожидание определяется
+    классом на момент постановки в очередь; повышение класса (promote)
+    переставляет запрос в очереди и защищает от вытеснения менее важными.
+    """
+
+    # Вес нового замера в скользящем среднем времени обработки
+    SERVICE_TIME_ALPHA = 0.2
+
+    def __init__(
+        self,
+        max_active: int = ADMISSION_MAX_ACTIVE,
+        max_queue: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.service_time = 1.0
+        # (класс, порядковый номер, имя класса, future ожидающего)
+        self._queue: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.stats: Dict[str, int] = {"admitted": 0, "enqueued": 0, "rejected": 0, "preempted": 0}
+
+    def _estimated_wait(self, level: int) -> float:
+        ahead = sum(1 for item in self._queue if item[0] <= level)
+        return (ahead // max(self.max_active, 1) + 1) * self.service_time
+
+    def _reject(self, priority: str, reason: str, retry_after: float) -> None:
+        self.stats["rejected"] += 1
+        ADMISSION_REJECTED.labels(priority, reason).inc()
+        raise Overloaded(reason, max(retry_after, 1.0))
+
+    def _remove(self, item: Tuple[int, int, str, asyncio.Future]) -> None:
+        self._queue.remove(item)
+        heapq.heapify(self._queue)
+        ADMISSION_QUEUE_DEPTH.labels(item[2]).dec()
+
+    def _admit(self, priority: str, waited: float) -> None:
+        self.active += 1
+        self.stats["admitted"] += 1
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAIT_SECONDS.labels(priority).observe(waited)
+
+    async def acquire(self, ticket: Ticket) -> None:
+        priority = ticket.priority
+        if self.max_active <= 0:
+            return
+        if self.active < self.max_active and not self._queue:
+            self._admit(priority, 0.0)
+            return
+
+        level = PRIORITIES[priority]
+        estimate = self._estimated_wait(level)
+        max_wait = stage_timeout(None if priority == "batch" else self.max_wait, ANSWER_RESERVE)
+        if max_wait is not None and estimate > max_wait:
+            self._reject(priority, "wait too long", estimate)
+        if len(self._queue) >= self.max_queue:
+            victim = max(self._queue)
+            if victim[0] <= level:
+                self._reject(priority, "queue full", estimate)
+            # Место в очереди занимает более важный запрос
+            logger.info(f"Admission queue full, preempting a '{victim[2]}' request for '{priority}'")
+            self._remove(victim)
+            self.stats["preempted"] += 1
+            ADMISSION_REJECTED.labels(victim[2], "preempted").inc()
+            victim[3].set_exception(Overloaded("preempted", estimate))
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        ticket.item = (level, next(self._seq), priority, waiter)
+        heapq.heappush(self._queue, ticket.item)
+        self.stats["enqueued"] += 1
+        ADMISSION_QUEUE_DEPTH.labels(priority).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._remove(ticket.item)
+                waiter.cancel()
+                self._reject(ticket.priority, "wait timeout", self._estimated_wait(PRIORITIES[ticket.priority]))
+            # Место выдали в момент таймаута — запрос всё-таки допущен
+            waiter.result()
+        except BaseException:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # Место уже выдано, но вызывающий отменён — возвращаем его
+                self.release(None)
+            elif ticket.item in self._queue:
+                self._remove(ticket.item)
+                waiter.cancel()
+            raise
+        finally:
+            ticket.item = None
+        ADMISSION_WAIT_SECONDS.labels(ticket.priority).observe(time.monotonic() - started)
+
+    def promote(self, ticket: Ticket, priority: str) -> None:
+        """Повышает класс билета (к вычислению присоединился более важный запрос)."""
+        if PRIORITIES[priority] >= PRIORITIES[ticket.priority]:
+            return
+        ticket.priority = priority
+        item = ticket.item
+        if item is None or item not in self._queue:
+            return
+        self._remove(item)
+        ticket.item = (PRIORITIES[priority], item[1], priority, item[3])
+        heapq.heappush(self._queue, ticket.item)
+        ADMISSION_QUEUE_DEPTH.labels(priority).inc()
+
+    def release(self, service_time: Optional[float]) -> None:
+        """service_time — сколько обрабатывался запрос (None — не учитывать)."""
+        if self.max_active <= 0:
+            return
+        self.active -= 1
+        if service_time is not None:
+            self.service_time += self.SERVICE_TIME_ALPHA * (service_time - self.service_time)
+        while self._queue and self.active < self.max_active:
+            _, _, priority, waiter = heapq.heappop(self._queue)
+            ADMISSION_QUEUE_DEPTH.labels(priority).dec()
+            if waiter.done():
+                continue
+            self.active += 1
+            self.stats["admitted"] += 1
+            waiter.set_result(None)
+        ADMISSION_ACTIVE.set(self.active)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "normal", ticket: Optional[Ticket] = None) -> AsyncIterator[None]:
+        """Место на время вычисления; ticket — общий билет объединённых запросов."""
+        await self.acquire(ticket if ticket is not None else Ticket(priority))
+        started = time.monotonic()
+        service_time: Optional[float] = None
+        try:
+            yield
+            service_time = time.monotonic() - started
+        finally:
+            self.release(service_time)
+
+    def snapshot(self) -> dict:
+        queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        for _, _, priority, _ in self._queue:
+            queued[priority] += 1
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queued": queued,
+            "service_time": round(self.service_time, 2),
+            **self.stats,
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SQLITE,
+)
+from .metrics import CACHE_LOOKUPS
+from .options import OPTION_RE
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Приводит вопрос к каноническому виду для ключа кэша: регистр, ё/е,
+    пробелы и нумерация вариантов ("1)", "1 -", "1." -> "1.").
+    """
+    lines = []
+    for line in query.replace("\r", "\n").split("\n"):
+        line = OPTION_RE.sub(r"\1. ", line)
+        line = re.sub(r"\s+", " ", line).strip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines).casefold().replace("ё", "е")
+
+
+def query_key(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Открывает SQLite-файл для совместной работы нескольких процессов:
+    WAL, autocommit и ожидание блокировки вместо немедленной ошибки.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class LRUCache:
+    """
+    Внутрипроцессный LRU-кэш с TTL. Не потокобезопасен: рассчитан на один event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Общий для всех воркеров gunicorn уровень кэша в SQLite-файле (WAL).
+    Все обращения к базе выполняются в пуле потоков, чтобы не блокировать event loop.
+    Хранит счётчик поколений: любая инвалидация увеличивает его, и воркеры
+    сбрасывают свои локальные LRU. Просроченные записи удаляются каждые
+    EVICT_EVERY записей.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение открывается в каждом процессе заново: после fork
+        # (gunicorn --preload) унаследованное соединение использовать нельзя
+        if self._conn is None or self._pid != os.getpid():
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_expires ON answers (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO answers (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            expired = self._connect().execute(
+                "DELETE FROM answers WHERE expires_at < ?", (time.time(),)
+            ).rowcount
+        if expired:
+            logger.info(f"Answer cache eviction: {expired} expired")
+
+    def _invalidate(self, key: Optional[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            if key is None:
+                removed = conn.execute("DELETE FROM answers").rowcount
+            else:
+                removed = conn.execute("DELETE FROM answers WHERE key = ?", (key,)).rowcount
+            conn.execute(
+                "INSERT INTO meta (name, value) VALUES ('generation', 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+            )
+            conn.execute("DELETE FROM answers WHERE expires_at < ?", (time.time(),))
+        return removed
+
+    def _generation(self) -> int:
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: dict) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+    async def invalidate(self, key: Optional[str] = None) -> int:
+        return await asyncio.to_thread(self._invalidate, key)
+
+    async def generation(self) -> int:
+        return await asyncio.to_thread(self._generation)
+
+
+class AnswerCache:
+    """
+    Двухуровневый кэш готовых ответов по нормализованному вопросу:
+    локальный LRU с TTL и (опционально) общий SQLite-файл для всех воркеров.
+    Значение — словарь {"answer", "reasoning", "sources"} без id запроса.
+    """
+
+    GENERATION_CHECK_INTERVAL = 1.0
+
+    def __init__(self, maxsize: int, ttl: float, sqlite_path: str = ""):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = SQLiteCache(sqlite_path, ttl) if sqlite_path else None
+        self.stats: Dict[str, int] = {"local_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0}
+        self._generation = 0
+        self._generation_checked_at = 0.0
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения общего кэша: меняется при каждой инвалидации в любом воркере."""
+        return self._generation
+
+    async def _sync_generation(self) -> None:
+        # Инвалидация в другом воркере должна сбросить и наш локальный уровень
+        now = time.monotonic()
+        if self.shared is None or now - self._generation_checked_at < self.GENERATION_CHECK_INTERVAL:
+            return
+        self._generation_checked_at = now
+        generation = await self.shared.generation()
+        if generation != self._generation:
+            self._generation = generation
+            self.local.clear()
+
+    async def get(self, query: str) -> Optional[dict]:
+        key = query_key(query)
+        try:
+            await self._sync_generation()
+            value = self.local.get(key)
+            if value is not None:
+                self.stats["local_hits"] += 1
+                CACHE_LOOKUPS.labels("answer", "local_hit").inc()
+                return value
+            if self.shared is not None:
+                value = await self.shared.get(key)
+                if value is not None:
+                    self.stats["shared_hits"] += 1
+                    CACHE_LOOKUPS.labels("answer", "shared_hit").inc()
+                    self.local.set(key, value)
+                    return value
+        except sqlite3.Error as e:
+            logger.error(f"Answer cache read error: {e}")
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.labels("answer", "miss").inc()
+        return None
+
+    async def set(self, query: str, value: dict) -> None:
+        key = query_key(query)
+        self.local.set(key, value)
+        self.stats["sets"] += 1
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value)
+            except sqlite3.Error as e:
+                logger.error(f"Answer cache write error: {e}")
+
+    async def invalidate(self, query: Optional[str] = None) -> int:
+        """Удаляет один вопрос (или весь кэш, если query не задан). Возвращает число удалённых записей."""
+        if query is None:
+            removed = len(self.local)
+            self.local.clear()
+        else:
+            key = query_key(query)
+            removed = 1 if self.local.get(key) is not None else 0
+            self.local.delete(key)
+        if self.shared is not None:
+            removed = max(removed, await self.shared.invalidate(None if query is None else query_key(query)))
+            self._generation = await self.shared.generation()
+        return removed
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["local_hits"] + self.stats["shared_hits"] + self.stats["misses"]
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "local_size": len(self.local),
+            "shared": self.shared is not None,
+            "pid": os.getpid(),
+        }
+
+
+answer_cache: Optional[AnswerCache] = (
+    AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SQLITE) if ANSWER_CACHE_ENABLED else None
+)
@@ -3,6 +3,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 KINOPOISK_API_KEY = os.getenv("KINOPOISK_API_KEY", "")
 SEARCH_API_KEY = os.getenv("SEARCH_API_KEY", "")
@@ -11,6 +19,217 @@ KINOPOISK_URL = os.getenv("KINOPOISK_URL", "")
 CX = os.getenv("CX", "")
 NUM_ANSWERS = 3
 MODEL_AUTH_KEY = os.getenv("MODEL_AUTH_KEY", "")
+MODEL_FOLDER_ID = os.getenv("MODEL_FOLDER_ID", "b1gensvl1uk7ugci74r7")
+MODEL_NAME = os.getenv("MODEL_NAME", "yandexgpt-32k")
+MODEL_VERSION = os.getenv("MODEL_VERSION", "rc")
+MODEL_TEMPERATURE = float(os.getenv("MODEL_TEMPERATURE", "0.2"))
+
+# Клиент LLM: бэкенд ("yandex" или "stub" для нагрузочных тестов),
+# верхняя граница адаптивного лимита одновременных вызовов на процесс
+# и таймаут одного вызова в секундах
+LLM_BACKEND = os.getenv("LLM_BACKEND", "yandex")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0.5"))
+STUB_LLM_ANSWER = os.getenv("STUB_LLM_ANSWER", "1")
+STUB_LLM_ERROR_RATE = float(os.getenv("STUB_LLM_ERROR_RATE", "0"))
+
+# Дедлайн запроса и бюджеты этапов, секунды. Дедлайн берётся из заголовка
+# X-Request-Timeout или REQUEST_DEADLINE (не больше REQUEST_DEADLINE_MAX,
+# чтобы уложиться в --timeout gunicorn). ANSWER_RESERVE оставляется на
+# финальный ответ: если до дедлайна меньше, поиск и сжатие урезаются или
+# пропускаются, а ответ строится по меньшему числу страниц или знаниям модели
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "50"))
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "110"))
+ANSWER_RESERVE = float(os.getenv("ANSWER_RESERVE", "10"))
+RETRIEVAL_MIN_TIME = float(os.getenv("RETRIEVAL_MIN_TIME", "3"))
+SEARCH_BUDGET = float(os.getenv("SEARCH_BUDGET", "15"))
+SERPSTACK_TIMEOUT = float(os.getenv("SERPSTACK_TIMEOUT", "5"))
+PAGE_FETCH_TIMEOUT = float(os.getenv("PAGE_FETCH_TIMEOUT", "2"))
+COMPRESS_TIMEOUT = float(os.getenv("COMPRESS_TIMEOUT", "15"))
+COMPRESS_MIN_TIME = float(os.getenv("COMPRESS_MIN_TIME", "2"))
+VARIANT_MIN_TIME = float(os.getenv("VARIANT_MIN_TIME", "1"))
+
+# Поиск ссылок: "sequential" (переформулировка LLM, затем поиск),
+# "speculative" (параллельно поиск по исходному вопросу; берётся первый
+# результат с не менее чем SPECULATIVE_MIN_URLS ссылками) или "fanout"
+# (оба поиска до конца, ссылки объединяются)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "speculative")
+SPECULATIVE_MIN_URLS = int(os.getenv("SPECULATIVE_MIN_URLS", "2"))
+
+# Загрузка страниц: Serpstack возвращает до SEARCH_RESULTS кандидатов, сразу
+# качаются FETCH_PARALLEL из них, и этап заканчивается на FETCH_PAGES удачных
+# страницах. Если загрузка дольше FETCH_HEDGE_PERCENTILE-перцентиля обычного
+# для её хоста времени (для незнакомого хоста — FETCH_HEDGE_DELAY секунд),
+# параллельно запускается следующий кандидат. Статистика хоста — последние
+# FETCH_STATS_WINDOW загрузок
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "8"))
+FETCH_PAGES = int(os.getenv("FETCH_PAGES", "3"))
+FETCH_PARALLEL = int(os.getenv("FETCH_PARALLEL", "4"))
+FETCH_HEDGE_PERCENTILE = float(os.getenv("FETCH_HEDGE_PERCENTILE", "0.9"))
+FETCH_HEDGE_DELAY = float(os.getenv("FETCH_HEDGE_DELAY", "0.5"))
+FETCH_STATS_WINDOW = int(os.getenv("FETCH_STATS_WINDOW", "50"))
+# Сколько ссылок отдавать в "sources": только загруженные страницы из контекста
+MAX_SOURCES = int(os.getenv("MAX_SOURCES", "5"))
+
+# Сжатие страниц: сколько страниц суммаризуется одновременно и нужно ли
+# начинать суммаризацию каждой страницы сразу после её загрузки
+COMPRESS_CONCURRENCY = int(os.getenv("COMPRESS_CONCURRENCY", "3"))
+COMPRESS_PIPELINED = _env_bool("COMPRESS_PIPELINED", True)
+
+# Общий HTTP-клиент: размер пула, лимит соединений на хост,
+# время жизни записей DNS-кэша и keep-alive в секундах
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+# Кэш ответов: размер локального LRU, TTL в секундах и путь к общему
+# SQLite-файлу для всех воркеров (пустая строка — только локальный уровень)
+ANSWER_CACHE_ENABLED = _env_bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SQLITE = os.getenv("ANSWER_CACHE_SQLITE", "cache/answers.sqlite3")
+
+# Смысловой кэш (в памяти воркера): перефразированный вопрос с тем же набором
+# вариантов получает готовый ответ, если косинусное сходство векторов вопросов
+# (слова взвешены по idf локального индекса) не ниже порога, различаются только
+# частые слова (вес не больше SEMANTIC_CACHE_MAX_UNMATCHED_WEIGHT, от 0 до 1),
+# а числа и названия совпадают. Без вариантов ответа проверить нечего — порог строже
+SEMANTIC_CACHE_ENABLED = _env_bool("SEMANTIC_CACHE_ENABLED", True)
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "4096"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_THRESHOLD_NO_OPTIONS = float(os.getenv("SEMANTIC_CACHE_THRESHOLD_NO_OPTIONS", "0.9"))
+SEMANTIC_CACHE_MAX_UNMATCHED_WEIGHT = float(os.getenv("SEMANTIC_CACHE_MAX_UNMATCHED_WEIGHT", "0.4"))
+
+# Хранилище страниц на диске: путь к SQLite-файлу (пусто — отключено),
+# максимальный объём текстов и выжимок в байтах, срок, в течение которого
+# копия считается свежей, и таймаут фонового обновления в секундах
+PAGE_STORE_PATH = os.getenv("PAGE_STORE_PATH", "cache/pages.sqlite3")
+PAGE_STORE_MAX_BYTES = int(os.getenv("PAGE_STORE_MAX_BYTES", str(200 * 1024 * 1024)))
+PAGE_STORE_FRESH_TTL = float(os.getenv("PAGE_STORE_FRESH_TTL", "86400"))
+PAGE_REFRESH_TIMEOUT = float(os.getenv("PAGE_REFRESH_TIMEOUT", "10"))
+# Время обращения к записи (для вытеснения) обновляется не чаще раза в столько секунд
+PAGE_STORE_TOUCH_INTERVAL = float(os.getenv("PAGE_STORE_TOUCH_INTERVAL", "600"))
+
+# Общий для воркеров кэш выдачи Serpstack и ответов модели: путь к SQLite-файлу
+# (пусто — отключено), максимальный объём в байтах и сроки годности записей.
+# Ответы модели кэшируются по хэшу промпта, модели и температуры
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "cache/shared.sqlite3")
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# Потоковая загрузка страниц: читать тело кусками по PAGE_CHUNK_SIZE байт,
+# не больше PAGE_MAX_BYTES и до набора PAGE_TEXT_TARGET_CHARS символов текста;
+# ответы с типом не из PAGE_CONTENT_TYPES пропускаются
+PAGE_STREAMING = _env_bool("PAGE_STREAMING", True)
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+PAGE_CHUNK_SIZE = int(os.getenv("PAGE_CHUNK_SIZE", str(64 * 1024)))
+PAGE_TEXT_TARGET_CHARS = int(os.getenv("PAGE_TEXT_TARGET_CHARS", "30000"))
+PAGE_CONTENT_TYPES = {
+    item.strip()
+    for item in os.getenv("PAGE_CONTENT_TYPES", "text/html,application/xhtml+xml,text/plain").split(",")
+    if item.strip()
+}
+
+# Извлечение текста из HTML: парсер ("auto", "selectolax" или "bs4"), число
+# процессов в пуле (0 — разбирать в текущем процессе) и размер страницы
+# в байтах, до которого разбор выполняется на месте без передачи в пул
+EXTRACT_PARSER = os.getenv("EXTRACT_PARSER", "auto")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_INLINE_MAX_BYTES = int(os.getenv("EXTRACT_INLINE_MAX_BYTES", "20000"))
+
+# Локальный BM25-индекс (python -m search_itmo.local_index build): каталог
+# индекса, порог уверенности, выше которого веб-поиск не нужен, число
+# пассажей в контексте, стемминг и длина пассажа в словах
+LOCAL_INDEX_ENABLED = _env_bool("LOCAL_INDEX_ENABLED", True)
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "index")
+LOCAL_INDEX_MIN_CONFIDENCE = float(os.getenv("LOCAL_INDEX_MIN_CONFIDENCE", "0.6"))
+LOCAL_INDEX_TOP_K = int(os.getenv("LOCAL_INDEX_TOP_K", "5"))
+INDEX_STEMMING = _env_bool("INDEX_STEMMING", True)
+INDEX_PASSAGE_WORDS = int(os.getenv("INDEX_PASSAGE_WORDS", "80"))
+
+# Отбор фрагментов страницы перед суммаризацией: предложения с наибольшим
+# совпадением со словами вопроса и KEYWORDS в пределах бюджета в токенах.
+# PASSAGE_MAX_CHARS — сколько символов страницы рассматривается,
+# CHARS_PER_TOKEN — оценка символов на токен YandexGPT для русского текста
+PASSAGE_SELECTION = _env_bool("PASSAGE_SELECTION", True)
+PASSAGE_TOKEN_BUDGET = int(os.getenv("PASSAGE_TOKEN_BUDGET", "500"))
+PASSAGE_QUERY_WEIGHT = float(os.getenv("PASSAGE_QUERY_WEIGHT", "3.0"))
+PASSAGE_MAX_CHARS = int(os.getenv("PASSAGE_MAX_CHARS", "30000"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3.0"))
+
+# Финальный ответ: "two_step" (пояснение, затем отдельный вызов для номера
+# варианта) или "single" (один вызов со структурированным JSON-ответом)
+ANSWER_MODE = os.getenv("ANSWER_MODE", "two_step")
+
+# Сначала ответ "по памяти": один вызов без поиска, модель сама оценивает
+# уверенность. "off" — всегда полный конвейер; "sequential" — поиск только если
+# уверенность ниже KNOWLEDGE_MIN_CONFIDENCE; "parallel" — поиск стартует сразу
+# и отменяется, если ответ по памяти уверенный (быстрее, но поиск тратится)
+KNOWLEDGE_MODE = os.getenv("KNOWLEDGE_MODE", "off")
+KNOWLEDGE_MIN_CONFIDENCE = float(os.getenv("KNOWLEDGE_MIN_CONFIDENCE", "0.85"))
+KNOWLEDGE_TIMEOUT = float(os.getenv("KNOWLEDGE_TIMEOUT", "8"))
+
+# Объединение одновременных одинаковых запросов (целиком и по этапам)
+SINGLEFLIGHT_ENABLED = _env_bool("SINGLEFLIGHT_ENABLED", True)
+
+# Адаптивные лимиты одновременных вызовов к YandexGPT и Serpstack (на процесс):
+# стартовое значение, нижняя граница и сколько вызовов может ждать в очереди
+# (остальные отклоняются, API отвечает 429). Временные сбои повторяются
+# UPSTREAM_RETRIES раз с задержкой от UPSTREAM_BACKOFF секунд; после
+# BREAKER_FAILURES сбоев подряд сервис не вызывается BREAKER_COOLDOWN секунд
+LLM_LIMIT_INITIAL = float(os.getenv("LLM_LIMIT_INITIAL", "8"))
+LLM_LIMIT_MIN = float(os.getenv("LLM_LIMIT_MIN", "1"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "8"))
+SEARCH_LIMIT_INITIAL = float(os.getenv("SEARCH_LIMIT_INITIAL", "4"))
+SEARCH_QUEUE_SIZE = int(os.getenv("SEARCH_QUEUE_SIZE", "32"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.2"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "10"))
+
+# Запросы дольше стольких секунд пишут в лог разбивку по этапам (JSON)
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "20"))
+
+# Журнал доступа (JSON-строки): файл общий для воркеров, пишется пачками
+# в фоне и ротируется по размеру. Тела запроса и ответа сохраняются для доли
+# ACCESS_LOG_BODY_SAMPLE запросов и обрезаются до ACCESS_LOG_BODY_MAX_BYTES
+ACCESS_LOG_PATH = os.getenv("ACCESS_LOG_PATH", "logs/api.log")
+ACCESS_LOG_STDOUT = _env_bool("ACCESS_LOG_STDOUT", True)
+ACCESS_LOG_BODY_SAMPLE = float(os.getenv("ACCESS_LOG_BODY_SAMPLE", "1.0"))
+ACCESS_LOG_BODY_MAX_BYTES = int(os.getenv("ACCESS_LOG_BODY_MAX_BYTES", "2048"))
+ACCESS_LOG_MAX_BYTES = int(os.getenv("ACCESS_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+ACCESS_LOG_BACKUPS = int(os.getenv("ACCESS_LOG_BACKUPS", "5"))
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "500"))
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", "1.0"))
+
+# /api/batch: сколько вопросов в одном запросе и сколько из них обрабатываются
+# одновременно (вызовы LLM всё равно ограничены общим LLM_MAX_CONCURRENCY)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "32"))
+
+# Допуск запросов в воркер: сколько вопросов считаются одновременно (0 — без
+# ограничения), сколько ждут в очереди и сколько секунд ожидания допустимо.
+# Запрос, который не успеет дождаться своей очереди, сразу получает 503.
+# Класс запроса — заголовок X-Priority: interactive, normal или batch
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "16"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "15"))
+
+# Прогрев воркера перед приёмом запросов (/readyz отвечает 503, пока он идёт):
+# SDK модели, файлы кэшей, локальный индекс, пул разбора HTML и соединения
+# с WARMUP_URLS (через запятую; по умолчанию — сервер Serpstack)
+WARMUP_ENABLED = _env_bool("WARMUP_ENABLED", True)
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "20"))
+WARMUP_URLS = [url.strip() for url in os.getenv("WARMUP_URLS", SEARCH_URL).split(",") if url.strip()]
+
+# Токен для служебных эндпоинтов /api/admin/* (пустой — эндпоинты недоступны)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 KEYWORDS = """
 итмо itmo университет university санкт-петербург st. petersburg
 образование education наука science исследования research
@@ -0,0 +1,63 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+
+from .config import REQUEST_DEADLINE, REQUEST_DEADLINE_MAX
+from .metrics import SKIPPED_STAGES
+
+logger = logging.getLogger(__name__)
+
+# Абсолютный дедлайн запроса (time.monotonic) и список пропущенных этапов.
+# Задачи, созданные внутри запроса, наследуют контекст и видят те же значения.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+_skipped: ContextVar[Optional[List[str]]] = ContextVar("skipped_stages", default=None)
+
+
+def start_request(timeout: Optional[float] = None) -> None:
+    """
+    Задаёт дедлайн текущего запроса: timeout секунд (из заголовка),
+    по умолчанию REQUEST_DEADLINE, но не больше REQUEST_DEADLINE_MAX.
+    """
+    if timeout is None or timeout <= 0:
+        timeout = REQUEST_DEADLINE
+    _deadline.set(time.monotonic() + min(timeout, REQUEST_DEADLINE_MAX))
+    _skipped.set([])
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (None — дедлайн не задан)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def stage_timeout(limit: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+    """
+    Бюджет этапа: не больше limit и не больше остатка времени за вычетом
+    reserve — времени, которое нужно оставить последующим этапам.
+    """
+    left = remaining()
+    if left is None:
+        return limit
+    left = max(left - reserve, 0.0)
+    return left if limit is None else min(limit, left)
+
+
+def has_time(needed: float, reserve: float = 0.0) -> bool:
+    left = remaining()
+    return left is None or left - reserve >= needed
+
+
+def skip(stage: str) -> None:
+    """Отмечает, что этап пропущен или урезан из-за нехватки времени."""
+    skipped = _skipped.get()
+    if skipped is not None and stage not in skipped:
+        skipped.append(stage)
+        SKIPPED_STAGES.labels(stage).inc()
+        logger.warning(f"Stage '{stage}' skipped, {remaining() or 0:.1f}s left before deadline")
+
+
+def skipped_stages() -> List[str]:
+    return list(_skipped.get() or [])
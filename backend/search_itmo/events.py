@@ -0,0 +1,30 @@
+import asyncio
+import json
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# Очередь событий текущего запроса (только для /api/request/stream).
+# Задачи, созданные внутри запроса, наследуют контекст и пишут в ту же очередь.
+_events: ContextVar[Optional[asyncio.Queue]] = ContextVar("events", default=None)
+
+
+def start_events() -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue()
+    _events.set(queue)
+    return queue
+
+
+def streaming() -> bool:
+    """Есть ли у текущего запроса получатель событий."""
+    return _events.get() is not None
+
+
+def emit(event: str, data: Any) -> None:
+    """Отправляет событие клиенту; без потокового запроса ничего не делает."""
+    queue = _events.get()
+    if queue is not None:
+        queue.put_nowait((event, data))
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
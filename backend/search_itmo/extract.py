@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .config import EXTRACT_PARSER, EXTRACT_WORKERS, EXTRACT_INLINE_MAX_BYTES
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+# Служебные элементы страницы, текст которых не несёт содержания
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_TAG_RE = re.compile(r"<[^>]*>")
+_SKIP_BLOCK_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class TextEstimator:
+    """
+    Грубая потоковая оценка объёма видимого текста в HTML: сколько символов
+    останется после удаления тегов, скриптов и стилей. Нужна, чтобы прекратить
+    скачивание, когда текста уже достаточно; точный разбор делает html_to_text.
+    """
+
+    def __init__(self):
+        self.chars = 0
+        self._tail = ""
+
+    def feed(self, chunk: str) -> int:
+        data = self._tail + chunk
+        # Незакрытый тег в конце куска переносим в следующий
+        cut = data.rfind("<")
+        if cut != -1 and data.find(">", cut) == -1:
+            self._tail, data = data[cut:], data[:cut]
+        else:
+            self._tail = ""
+        data = _SKIP_BLOCK_RE.sub(" ", data)
+        text = _WHITESPACE_RE.sub(" ", _TAG_RE.sub(" ", data))
+        self.chars += len(text.strip())
+        return self.chars
+
+
+def _extract_selectolax(html: str) -> str:
+    tree = HTMLParser(html)
+    tree.strip_tags(list(BOILERPLATE_TAGS))
+    root = tree.body or tree.root
+    return root.text(separator=" ") if root is not None else ""
+
+
+def _extract_bs4(html: str) -> str:
+    # bs4 нужен, только если нет selectolax: не тратим на него время при старте воркера
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    return soup.get_text(" ")
+
+
+def html_to_text(html: str, parser: str = EXTRACT_PARSER) -> str:
+    """
+    Извлекает текст страницы без служебных блоков (скрипты, стили, навигация,
+    подвал) и схлопывает пробелы. parser: "selectolax", "bs4" или "auto" —
+    selectolax, если он установлен.
+    """
+    if parser == "selectolax" or (parser == "auto" and HTMLParser is not None):
+        if HTMLParser is None:
+            raise RuntimeError("selectolax is not installed")
+        text = _extract_selectolax(html)
+    else:
+        text = _extract_bs4(html)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: воркер uvicorn многопоточный (to_thread, SQLite),
+        # и fork из такого процесса может унаследовать захваченные блокировки
+        _pool = ProcessPoolExecutor(
+            max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def extract_text(html: str) -> str:
+    """
+    Асинхронная обёртка над html_to_text. Большие страницы разбираются в пуле
+    процессов, чтобы не блокировать event loop; маленькие — на месте,
+    потому что передача в другой процесс обходится дороже самого разбора.
+    """
+    if EXTRACT_WORKERS <= 0 or len(html) <= EXTRACT_INLINE_MAX_BYTES:
+        return html_to_text(html)
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, html_to_text, html)
+    except BrokenProcessPool:
+        # Процесс пула умер (например, по OOM на огромной странице), и пул больше
+        # не принимает задач: следующие страницы пойдут в новый пул, а эта
+        # разбирается в потоке этого процесса
+        from .metrics import EXTRACT_POOL_RESETS
+
+        if _pool is pool:
+            logger.error("Extract process pool is broken, recreating it")
+            EXTRACT_POOL_RESETS.inc()
+            shutdown_extract_pool()
+        return await asyncio.to_thread(html_to_text, html)
+
+
+async def warm_extract_pool() -> None:
+    """Запускает процессы пула заранее, чтобы первая большая страница не ждала их старта."""
+    if EXTRACT_WORKERS <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(pool, html_to_text, "<p></p>") for _ in range(EXTRACT_WORKERS)))
+    except BrokenProcessPool:
+        # Сломанный пул не чинится сам: пусть первый запрос создаст новый
+        shutdown_extract_pool()
+        raise
+
+
+def shutdown_extract_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,83 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+from .config import FETCH_HEDGE_PERCENTILE, FETCH_HEDGE_DELAY, FETCH_STATS_WINDOW
+
+
+def host_of(link: str) -> str:
+    return (urlsplit(link).hostname or "").lower()
+
+
+class _Host:
+    __slots__ = ("latencies", "failure_rate")
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.failure_rate = 0.0
+
+
+class HostStats:
+    """
+    Статистика загрузок страниц по хостам в этом воркере: последние window
+    длительностей успешных загрузок и скользящая доля неудач. По ней
+    планировщик загрузок (iter_page_texts) решает, в каком порядке качать
+    ссылки, когда запускать запасную загрузку и сколько ждать хост.
+    Хранится не больше max_hosts хостов, давно не встречавшиеся забываются.
+    """
+
+    # Вес нового исхода в доле неудач и минимум замеров для перцентилей
+    FAILURE_ALPHA = 0.2
+    MIN_SAMPLES = 3
+
+    def __init__(self, window: int = FETCH_STATS_WINDOW, max_hosts: int = 1024):
+        self.window = window
+        self.max_hosts = max_hosts
+        self._hosts: "OrderedDict[str, _Host]" = OrderedDict()
+
+    def record(self, host: str, latency: float, ok: bool) -> None:
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = _Host(self.window)
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        self._hosts.move_to_end(host)
+        if ok:
+            stats.latencies.append(latency)
+        stats.failure_rate += self.FAILURE_ALPHA * ((0.0 if ok else 1.0) - stats.failure_rate)
+
+    def percentile(self, host: str, q: float) -> Optional[float]:
+        """q-перцентиль длительности загрузки (None — замеров слишком мало)."""
+        stats = self._hosts.get(host)
+        if stats is None or len(stats.latencies) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(stats.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def failure_rate(self, host: str) -> float:
+        stats = self._hosts.get(host)
+        return stats.failure_rate if stats is not None else 0.0
+
+    def hedge_delay(self, host: str) -> float:
+        """Через сколько секунд загрузку с хоста считать медленной и запускать запасную."""
+        latency = self.percentile(host, FETCH_HEDGE_PERCENTILE)
+        return FETCH_HEDGE_DELAY if latency is None else latency
+
+    def unreliable(self, host: str, budget: float) -> bool:
+        """Хост чаще отказывает, чем отвечает, или обычно не укладывается в budget секунд."""
+        median = self.percentile(host, 0.5)
+        return self.failure_rate(host) > 0.5 or (median is not None and median > budget)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            host: {
+                "samples": len(stats.latencies),
+                "p50": self.percentile(host, 0.5),
+                "p90": self.percentile(host, 0.9),
+                "failure_rate": round(stats.failure_rate, 3),
+            }
+            for host, stats in self._hosts.items()
+        }
+
+
+host_stats = HostStats()
@@ -0,0 +1,85 @@
+import codecs
+import logging
+import re
+from typing import Optional
+
+import aiohttp
+
+from .config import (
+    HTTP_POOL_LIMIT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_DNS_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+
+def detect_charset(body: bytes) -> str:
+    """
+    Кодировка страницы, у которой её нет в заголовке Content-Type: из
+    <meta charset> или <meta http-equiv> в начале документа, иначе UTF-8,
+    если байты в ней корректны, иначе cp1251 или koi8-r — у них строчные и
+    заглавные буквы кириллицы лежат в противоположных половинах 0xC0-0xFF,
+    а в русском тексте строчных больше. body может быть началом тела.
+    """
+    match = _META_CHARSET_RE.search(body[:4096])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(body)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    upper = sum(1 for byte in body if 0xC0 <= byte <= 0xDF)
+    lower = sum(1 for byte in body if byte >= 0xE0)
+    return "koi8-r" if upper > lower else "cp1251"
+
+
+async def start_http_client() -> aiohttp.ClientSession:
+    """
+    Создаёт общий на весь процесс aiohttp-клиент: пул соединений с keep-alive,
+    лимитом на хост и кэшем DNS. Вызывается из startup_event.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    _session = aiohttp.ClientSession(
+        connector=connector, fallback_charset_resolver=lambda resp, body: detect_charset(body)
+    )
+    logger.info(
+        f"HTTP client started: limit={HTTP_POOL_LIMIT}, per_host={HTTP_LIMIT_PER_HOST}, dns_ttl={HTTP_DNS_TTL}s"
+    )
+    return _session
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общий клиент. Если приложение его ещё не создало (скрипты,
+    отдельный вызов сервисов), клиент создаётся лениво.
+    """
+    if _session is None or _session.closed:
+        return await start_http_client()
+    return _session
+
+
+async def close_http_client() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import aiohttp
+
+from .config import (
+    LLM_LIMIT_INITIAL,
+    LLM_LIMIT_MIN,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_SIZE,
+    SEARCH_LIMIT_INITIAL,
+    SEARCH_MAX_CONCURRENCY,
+    SEARCH_QUEUE_SIZE,
+    UPSTREAM_RETRIES,
+    UPSTREAM_BACKOFF,
+    BREAKER_FAILURES,
+    BREAKER_COOLDOWN,
+)
+from .metrics import UPSTREAM_INFLIGHT, UPSTREAM_LIMIT, UPSTREAM_REJECTED, UPSTREAM_RETRIES_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Вызов к внешнему сервису не выполнен: очередь переполнена или цепь разомкнута."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UpstreamHTTPError(Exception):
+    """HTTP-ответ внешнего сервиса, после которого вызов стоит повторить (429, 5xx)."""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Признак перегрузки или временного сбоя сервиса: таймаут, ошибка соединения,
+    HTTP 429/5xx, gRPC RESOURCE_EXHAUSTED/UNAVAILABLE/DEADLINE_EXCEEDED.
+    Такие ошибки уменьшают лимит, повторяются и размыкают цепь.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, aiohttp.ClientConnectionError, UpstreamHTTPError)):
+        return True
+    code = getattr(exc, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return False
+    return getattr(code, "name", None) in ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED")
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель одновременных вызовов к одному внешнему сервису.
+
+    Лимит подбирается по AIMD: каждый успешный вызов прибавляет 1/limit
+    (примерно +1 за "окно" из limit вызовов), признак перегрузки (is_transient)
+    уменьшает лимит вдвое, но не чаще раза в секунду. Ждать свободного места
+    могут не больше max_queue вызовов, остальные сразу получают
+    UpstreamUnavailable — запрос отклоняется вместо того, чтобы копиться.
+
+    Цепь размыкается после breaker_failures временных сбоев подряд: cooldown
+    секунд вызовы отклоняются без обращения к сервису, затем пропускается
+    один пробный вызов, и его успех замыкает цепь, а сбой снова размыкает.
+    Исходы вызовов, начатых до размыкания, состояние цепи не меняют: acquire
+    возвращает признак пробного вызова, и его нужно передать в release.
+    """
+
+    DECREASE_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        name: str,
+        initial: float,
+        max_limit: float,
+        min_limit: float = 1,
+        max_queue: int = 64,
+        retries: int = UPSTREAM_RETRIES,
+        backoff: float = UPSTREAM_BACKOFF,
+        breaker_failures: int = BREAKER_FAILURES,
+        cooldown: float = BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.cooldown = cooldown
+        self.inflight = 0
+        self.failures = 0
+        self.state = "closed"
+        self.opened_until = 0.0
+        self._probe = False
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats: Dict[str, int] = {"ok": 0, "transient": 0, "errors": 0, "rejected": 0, "retries": 0}
+        # Лимит публикуется из процесса, который вызывает сервис (см. acquire)
+        self._metrics_pid: Optional[int] = None
+
+    # --- цепь ---
+
+    def _check_breaker(self) -> bool:
+        """Пропускает вызов или отклоняет его; True — это пробный вызов полуоткрытой цепи."""
+        if self.state == "closed":
+            return False
+        now = time.monotonic()
+        if self.state == "open":
+            if now < self.opened_until:
+                self._reject("circuit open", self.opened_until - now)
+            self.state = "half_open"
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+        if self._probe:
+            self._reject("circuit half-open", self.cooldown)
+        self._probe = True
+        return True
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_until = time.monotonic() + self.cooldown
+        self._probe = False
+        logger.warning(f"Circuit '{self.name}' opened for {self.cooldown:g}s after {self.failures} failures")
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.stats["rejected"] += 1
+        UPSTREAM_REJECTED.labels(self.name, reason).inc()
+        raise UpstreamUnavailable(self.name, reason, retry_after)
+
+    # --- слоты ---
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.inflight += 1
+            waiter.set_result(None)
+        UPSTREAM_INFLIGHT.labels(self.name).set(self.inflight)
+
+    async def acquire(self) -> bool:
+        """Занимает место; возвращает признак пробного вызова (передаётся в release)."""
+        if self._metrics_pid != os.getpid():
+            # Не в конструкторе: с preload_app он выполняется в мастере gunicorn,
+            # чей файл gauge (livesum) никто не удаляет, и лимит считался бы лишний раз
+            self._metrics_pid = os.getpid()
+            UPSTREAM_LIMIT.labels(self.name).set(self.limit)
+        probe = self._check_breaker()
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            UPSTREAM_INFLIGHT.labels(self.name).set(self.inflight)
+            return probe
+        if len(self._waiters) >= self.max_queue:
+            if probe:
+                self._probe = False
+            self._reject("queue full", self.backoff * 4)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже выдан, но вызывающий отменён — возвращаем его
+                self.release(None, probe)
+            else:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                if probe:
+                    self._probe = False
+            raise
+        return probe
+
+    def release(self, outcome: Optional[str], probe: bool = False) -> None:
+        """
+        outcome: "ok", "transient", "error" или None (отмена — без выводов о сервисе).
+        probe — результат acquire: только исход пробного вызова замыкает или
+        снова размыкает цепь.
+        """
+        self.inflight -= 1
+        now = time.monotonic()
+        if outcome == "ok":
+            self.stats["ok"] += 1
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            if probe:
+                logger.info(f"Circuit '{self.name}' closed")
+                self.state = "closed"
+            if self.state == "closed":
+                self.failures = 0
+        elif outcome == "transient":
+            self.stats["transient"] += 1
+            self.failures += 1
+            if now - self._last_decrease >= self.DECREASE_INTERVAL:
+                self._last_decrease = now
+                self.limit = max(self.limit / 2, self.min_limit)
+            if probe or (self.state == "closed" and self.failures >= self.breaker_failures):
+                self._open()
+        elif outcome == "error":
+            self.stats["errors"] += 1
+        if probe:
+            self._probe = False
+        UPSTREAM_LIMIT.labels(self.name).set(self.limit)
+        self._wake()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], retries: Optional[int] = None) -> Any:
+        """
+        Выполняет fn() под лимитом. Временные сбои повторяются до retries раз
+        с экспоненциальной задержкой и случайным разбросом ±50%.
+        """
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            probe = await self.acquire()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.release(None, probe)
+                raise
+            except Exception as e:
+                transient = is_transient(e)
+                self.release("transient" if transient else "error", probe)
+                if not transient or attempt >= retries:
+                    raise
+                logger.warning(f"{self.name} call failed ({type(e).__name__}), retry {attempt + 1}/{retries}")
+            else:
+                self.release("ok", probe)
+                return result
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            self.stats["retries"] += 1
+            UPSTREAM_RETRIES_TOTAL.labels(self.name).inc()
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "state": self.state,
+            "failures": self.failures,
+            **self.stats,
+        }
+
+
+llm_limiter = AdaptiveLimiter(
+    "llm", LLM_LIMIT_INITIAL, LLM_MAX_CONCURRENCY, LLM_LIMIT_MIN, LLM_QUEUE_SIZE
+)
+search_limiter = AdaptiveLimiter(
+    "serpstack", SEARCH_LIMIT_INITIAL, SEARCH_MAX_CONCURRENCY, 1, SEARCH_QUEUE_SIZE
+)
+LIMITERS: Dict[str, AdaptiveLimiter] = {limiter.name: limiter for limiter in (llm_limiter, search_limiter)}
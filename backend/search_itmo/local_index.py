@@ -0,0 +1,375 @@
+"""
+Локальный BM25-индекс по корпусу страниц об ИТМО.
+
+Индекс строится офлайн из хранилища страниц (page_store) и/или каталога
+с файлами и лежит на диске набором бинарных массивов, которые воркеры
+отображают в память (mmap) — память делится между всеми процессами.
+
+    python -m search_itmo.local_index build  [--store cache/pages.sqlite3] [--docs DIR] [--out index]
+    python -m search_itmo.local_index update [--store cache/pages.sqlite3] [--out index]
+    python -m search_itmo.local_index query "Сколько кампусов у ИТМО?"
+
+build строит индекс заново, update добавляет к сохранённому корпусу
+страницы, появившиеся или обновившиеся в хранилище, и перестраивает индекс.
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .config import (
+    LOCAL_INDEX_PATH,
+    INDEX_STEMMING,
+    INDEX_PASSAGE_WORDS,
+    PAGE_STORE_PATH,
+)
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOPWORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только
+    ее мне было вот от меня еще нет о из ему теперь когда даже ну ли если уже или ни быть был
+    него до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо
+    ней для мы тебя их чем была сам чтобы без будто чего раз тоже себе под будет ж тогда кто
+    этот того потому этого какой совсем ним здесь этом почти мой тем нее сейчас были
+    куда зачем всех никогда можно при наконец об другой хоть после над больше тот через эти
+    нас про всего них какая много разве эту моя впрочем хорошо свою этой перед иногда лучше
+    чуть том нельзя такой им более всегда конечно всю между сколько каком какие каких
+    the a an of in on and or to for is are was were by with at from as be this that
+    """.split()
+)
+
+
+class Tokenizer:
+    """Нижний регистр, ё -> е, стоп-слова и (если доступен snowballstemmer) стемминг."""
+
+    def __init__(self, stemming: bool = INDEX_STEMMING):
+        self.stemming = stemming and snowballstemmer is not None
+        if self.stemming:
+            self._ru = snowballstemmer.stemmer("russian")
+            self._en = snowballstemmer.stemmer("english")
+        self._memo: Dict[str, str] = {}
+
+    def _stem(self, word: str) -> str:
+        stem = self._memo.get(word)
+        if stem is None:
+            stemmer = self._ru if _CYRILLIC_RE.search(word) else self._en
+            stem = stemmer.stemWord(word)
+            if len(self._memo) < 200000:
+                self._memo[word] = stem
+        return stem
+
+    def __call__(self, text: str) -> List[str]:
+        words = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+        tokens = [w for w in words if w not in STOPWORDS]
+        if self.stemming:
+            tokens = [self._stem(w) for w in tokens]
+        return tokens
+
+
+class Hit(NamedTuple):
+    score: float
+    url: str
+    text: str
+
+
+def split_passages(text: str, words: int = INDEX_PASSAGE_WORDS) -> List[str]:
+    """Окна по words слов с перекрытием в половину окна."""
+    tokens = text.split()
+    if len(tokens) <= words:
+        return [" ".join(tokens)] if tokens else []
+    step = max(words // 2, 1)
+    return [" ".join(tokens[i:i + words]) for i in range(0, len(tokens) - step, step)]
+
+
+def _write_array(path: str, typecode: str, values: Iterable[int]) -> None:
+    with open(path, "wb") as f:
+        array(typecode, values).tofile(f)
+
+
+def build_index(corpus: Dict[str, str], out: str, stemming: bool = INDEX_STEMMING) -> dict:
+    """
+    Строит индекс по корпусу {url: текст} в каталог out. Запись идёт во
+    временный каталог, который затем атомарно подменяет старый.
+    """
+    tokenizer = Tokenizer(stemming)
+    urls = sorted(corpus)
+    passage_urls: List[int] = []
+    passages: List[str] = []
+    for url_id, url in enumerate(urls):
+        for passage in split_passages(corpus[url]):
+            passage_urls.append(url_id)
+            passages.append(passage)
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths: List[int] = []
+    for doc_id, passage in enumerate(passages):
+        counts = Counter(tokenizer(passage))
+        doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, min(tf, 65535)))
+
+    tmp = out.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    terms: Dict[str, List[int]] = {}
+    docs = array("I")
+    tfs = array("H")
+    for term in sorted(postings):
+        items = postings[term]
+        terms[term] = [len(items), len(docs)]
+        docs.extend(doc_id for doc_id, _ in items)
+        tfs.extend(tf for _, tf in items)
+    with open(os.path.join(tmp, "postings_docs.u32"), "wb") as f:
+        docs.tofile(f)
+    with open(os.path.join(tmp, "postings_tf.u16"), "wb") as f:
+        tfs.tofile(f)
+    _write_array(os.path.join(tmp, "doclen.u32"), "I", doc_lengths)
+    _write_array(os.path.join(tmp, "passage_urls.u32"), "I", passage_urls)
+
+    offsets = [0]
+    with open(os.path.join(tmp, "passages.txt"), "wb") as f:
+        for passage in passages:
+            data = passage.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    _write_array(os.path.join(tmp, "passage_offsets.u64"), "Q", offsets)
+
+    with open(os.path.join(tmp, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+    with open(os.path.join(tmp, "urls.json"), "w", encoding="utf-8") as f:
+        json.dump(urls, f, ensure_ascii=False)
+    with open(os.path.join(tmp, "corpus.jsonl"), "w", encoding="utf-8") as f:
+        for url in urls:
+            f.write(json.dumps({"url": url, "text": corpus[url]}, ensure_ascii=False) + "\n")
+
+    meta = {
+        "n_docs": len(passages),
+        "n_urls": len(urls),
+        "n_terms": len(terms),
+        "avgdl": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+        "k1": K1,
+        "b": B,
+        "stemming": tokenizer.stemming,
+        "built_at": time.time(),
+    }
+    # meta.json пишется последним: по нему воркеры замечают новый индекс
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old = out.rstrip("/") + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out):
+        os.rename(out, old)
+    os.rename(tmp, out)
+    shutil.rmtree(old, ignore_errors=True)
+    return meta
+
+
+def _mmap_array(path: str, typecode: str):
+    size = os.path.getsize(path)
+    if size == 0:
+        return array(typecode), None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode), mm
+
+
+class LocalIndex:
+    """Индекс, открытый только для чтения; массивы отображены в память."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.terms: Dict[str, List[int]] = json.load(f)
+        with open(os.path.join(path, "urls.json"), encoding="utf-8") as f:
+            self.urls: List[str] = json.load(f)
+        self._mmaps = []
+        self.docs = self._open("postings_docs.u32", "I")
+        self.tfs = self._open("postings_tf.u16", "H")
+        self.doclen = self._open("doclen.u32", "I")
+        self.passage_urls = self._open("passage_urls.u32", "I")
+        self.offsets = self._open("passage_offsets.u64", "Q")
+        self.text = self._open("passages.txt", "B")
+        self.tokenizer = Tokenizer(self.meta["stemming"])
+        self.n_docs = self.meta["n_docs"]
+        self.avgdl = self.meta["avgdl"] or 1.0
+
+    def _open(self, name: str, typecode: str):
+        view, mm = _mmap_array(os.path.join(self.path, name), typecode)
+        if mm is not None:
+            self._mmaps.append(mm)
+        return view
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def passage(self, doc_id: int) -> str:
+        start, end = self.offsets[doc_id], self.offsets[doc_id + 1]
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def search(self, query: str, k: int = 5) -> Tuple[List[Hit], float]:
+        """
+        Возвращает до k лучших пассажей и уверенность в [0, 1]: BM25 лучшего
+        пассажа относительно суммы idf слов запроса, то есть 1.0 — все слова
+        запроса встречаются в пассаже средней длины хотя бы по разу.
+        """
+        k1, b = self.meta["k1"], self.meta["b"]
+        query_terms = set(self.tokenizer(query))
+        scores: Dict[int, float] = {}
+        max_score = 0.0
+        for term in query_terms:
+            entry = self.terms.get(term)
+            if entry is None:
+                # Слова запроса, которых нет в корпусе, тоже снижают уверенность
+                max_score += self.idf(0)
+                continue
+            df, offset = entry
+            idf = self.idf(df)
+            max_score += idf
+            for i in range(offset, offset + df):
+                doc_id = self.docs[i]
+                tf = self.tfs[i]
+                norm = k1 * (1 - b + b * self.doclen[doc_id] / self.avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        if not scores:
+            return [], 0.0
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        hits = [Hit(score, self.urls[self.passage_urls[doc_id]], self.passage(doc_id)) for doc_id, score in best]
+        confidence = min(best[0][1] / max_score, 1.0) if max_score else 0.0
+        return hits, confidence
+
+
+_index: Optional[LocalIndex] = None
+_index_mtime = 0.0
+_index_checked_at = 0.0
+
+RELOAD_CHECK_INTERVAL = 60.0
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """
+    Индекс процесса (лениво, с перечиткой, если индекс был перестроен).
+    None, если индекс ещё не построен.
+    """
+    global _index, _index_mtime, _index_checked_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+    _index_checked_at = now
+    try:
+        mtime = os.path.getmtime(os.path.join(LOCAL_INDEX_PATH, "meta.json"))
+    except OSError:
+        return _index
+    if _index is None or mtime != _index_mtime:
+        try:
+            _index = LocalIndex(LOCAL_INDEX_PATH)
+            _index_mtime = mtime
+            logger.info(f"Local index loaded: {_index.meta['n_docs']} passages, {_index.meta['n_urls']} pages")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load local index: {e}")
+    return _index
+
+
+def load_store_pages(store_path: str) -> Dict[str, Tuple[str, float]]:
+    if not store_path or not os.path.exists(store_path):
+        return {}
+    conn = sqlite3.connect(store_path)
+    try:
+        rows = conn.execute("SELECT url, text, fetched_at FROM pages").fetchall()
+    finally:
+        conn.close()
+    return {url: (text, fetched_at) for url, text, fetched_at in rows if text}
+
+
+def load_docs_dir(path: str) -> Dict[str, str]:
+    from .extract import html_to_text
+
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if not os.path.isfile(full):
+            continue
+        with open(full, encoding="utf-8", errors="replace") as f:
+            content = f.read()
+        text = html_to_text(content) if name.endswith((".html", ".htm")) else re.sub(r"\s+", " ", content).strip()
+        if text:
+            corpus[f"file://{os.path.abspath(full)}"] = text
+    return corpus
+
+
+def load_corpus(path: str) -> Dict[str, str]:
+    corpus_path = os.path.join(path, "corpus.jsonl")
+    corpus = {}
+    if os.path.exists(corpus_path):
+        with open(corpus_path, encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                corpus[item["url"]] = item["text"]
+    return corpus
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local BM25 index over ITMO pages")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("build", "update"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--store", default=PAGE_STORE_PATH, help="SQLite-файл хранилища страниц")
+        cmd.add_argument("--out", default=LOCAL_INDEX_PATH, help="каталог индекса")
+        cmd.add_argument("--no-stemming", action="store_true")
+        if name == "build":
+            cmd.add_argument("--docs", help="каталог с дополнительными .html/.txt файлами")
+    query_cmd = sub.add_parser("query")
+    query_cmd.add_argument("text")
+    query_cmd.add_argument("--index", default=LOCAL_INDEX_PATH)
+    query_cmd.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "query":
+        index = LocalIndex(args.index)
+        start = time.perf_counter()
+        hits, confidence = index.search(args.text, args.k)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"confidence={confidence:.3f} ({elapsed:.0f} µs)")
+        for hit in hits:
+            print(f"{hit.score:7.3f}  {hit.url}\n         {hit.text[:200]}")
+        return
+
+    corpus = load_corpus(args.out) if args.command == "update" else {}
+    corpus.update({url: text for url, (text, _) in load_store_pages(args.store).items()})
+    if getattr(args, "docs", None):
+        corpus.update(load_docs_dir(args.docs))
+    meta = build_index(corpus, args.out, stemming=not args.no_stemming and INDEX_STEMMING)
+    print(
+        f"Indexed {meta['n_urls']} pages, {meta['n_docs']} passages, {meta['n_terms']} terms "
+        f"(stemming={'on' if meta['stemming'] else 'off'}) -> {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from .config import SLOW_REQUEST_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Метрики собираются в каждом воркере; при заданной PROMETHEUS_MULTIPROC_DIR
+# prometheus_client пишет их в общий каталог, и /metrics любого воркера
+# отдаёт сумму по всем (см. start.sh и gunicorn.conf.py)
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+STAGE_SECONDS = Histogram(
+    "itmo_stage_seconds", "Duration of pipeline stages", ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("itmo_requests_total", "Finished /api/request calls", ["outcome"])
+INFLIGHT_REQUESTS = Gauge(
+    "itmo_inflight_requests", "Requests being processed", multiprocess_mode="livesum"
+)
+LLM_CALLS = Counter("itmo_llm_calls_total", "LLM calls by outcome", ["outcome"])
+LLM_TOKENS = Counter("itmo_llm_tokens_total", "LLM tokens", ["kind"])
+INFLIGHT_LLM = Gauge("itmo_inflight_llm_calls", "LLM calls in flight", multiprocess_mode="livesum")
+CACHE_LOOKUPS = Counter("itmo_cache_lookups_total", "Cache lookups", ["cache", "result"])
+FETCH_BYTES = Counter("itmo_fetch_bytes_total", "Bytes of page bodies read")
+PAGES_FETCHED = Counter("itmo_pages_fetched_total", "Page downloads by outcome", ["outcome"])
+FETCH_HEDGES = Counter("itmo_fetch_hedges_total", "Backup page fetches launched", ["reason"])
+EXTRACT_POOL_RESETS = Counter("itmo_extract_pool_resets_total", "HTML extraction pools recreated after a worker died")
+INFLIGHT_FETCHES = Gauge("itmo_inflight_fetches", "Page downloads in flight", multiprocess_mode="livesum")
+UPSTREAM_LIMIT = Gauge(
+    "itmo_upstream_limit", "Adaptive concurrency limit per upstream", ["upstream"], multiprocess_mode="livesum"
+)
+UPSTREAM_INFLIGHT = Gauge(
+    "itmo_upstream_inflight", "Upstream calls in flight", ["upstream"], multiprocess_mode="livesum"
+)
+UPSTREAM_REJECTED = Counter(
+    "itmo_upstream_rejected_total", "Upstream calls shed by the limiter", ["upstream", "reason"]
+)
+UPSTREAM_RETRIES_TOTAL = Counter("itmo_upstream_retries_total", "Upstream call retries", ["upstream"])
+ADMISSION_ACTIVE = Gauge(
+    "itmo_admission_active", "Requests admitted and being processed", multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "itmo_admission_queue_depth", "Requests waiting for admission", ["priority"], multiprocess_mode="livesum"
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "itmo_admission_wait_seconds", "Time spent waiting for admission", ["priority"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "itmo_admission_rejected_total", "Requests shed by admission control", ["priority", "reason"]
+)
+KNOWLEDGE_ANSWERS = Counter(
+    "itmo_knowledge_answers_total", "Closed-book answers: accepted or escalated to retrieval", ["result"]
+)
+SKIPPED_STAGES = Counter("itmo_skipped_stages_total", "Stages skipped because of the deadline", ["stage"])
+
+# Спаны текущего запроса: (этап, смещение от начала запроса, длительность)
+_spans: ContextVar[Optional[List[tuple]]] = ContextVar("spans", default=None)
+_trace_started: ContextVar[float] = ContextVar("trace_started", default=0.0)
+
+
+def start_trace() -> None:
+    _spans.set([])
+    _trace_started.set(time.perf_counter())
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Замеряет этап: гистограмма itmo_stage_seconds и спан текущего запроса."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(duration)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((stage, start - _trace_started.get(), duration))
+
+
+def finish_trace(request_id: int, total: float) -> None:
+    """Для медленных запросов пишет в лог все спаны в JSON."""
+    spans = _spans.get()
+    if spans is None or total < SLOW_REQUEST_THRESHOLD:
+        return
+    dump = {
+        "id": request_id,
+        "total": round(total, 3),
+        "spans": [
+            {"stage": stage, "start": round(offset, 3), "duration": round(duration, 3)}
+            for stage, offset, duration in sorted(spans, key=lambda span: span[1])
+        ],
+    }
+    logger.warning(f"Slow request: {json.dumps(dump, ensure_ascii=False)}")
+
+
+def render_metrics() -> tuple:
+    """Тело и Content-Type ответа /metrics."""
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,13 +1,170 @@
+import asyncio
+import importlib
 import logging
-from yandex_cloud_ml_sdk import YCloudML
-from .config import MODEL_AUTH_KEY
+import os
+import random
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .config import (
+    MODEL_AUTH_KEY,
+    MODEL_FOLDER_ID,
+    MODEL_NAME,
+    MODEL_VERSION,
+    MODEL_TEMPERATURE,
+    LLM_BACKEND,
+    LLM_TIMEOUT,
+    LLM_CACHE_TTL,
+    STUB_LLM_LATENCY,
+    STUB_LLM_ANSWER,
+    STUB_LLM_ERROR_RATE,
+    CHARS_PER_TOKEN,
+)
+from .deadline import stage_timeout
+from .limiter import UpstreamUnavailable, is_transient, llm_limiter
+from .metrics import INFLIGHT_LLM, LLM_CALLS, LLM_TOKENS
+from .shared_cache import shared_cache
+from .singleflight import SingleFlight, messages_key
 
 logger = logging.getLogger("uvicorn")
 
-sdk = YCloudML(folder_id="b1gensvl1uk7ugci74r7", auth=MODEL_AUTH_KEY)
-model = sdk.models.completions("yandexgpt-32k", model_version="rc").configure(temperature=0.2)
 
-async def run_model(messages: list[dict]) -> str:
+class LLMBackend:
+    """
+    Интерфейс бэкенда LLM. Реализация должна быть честно асинхронной:
+    отмена корутины complete() обязана прерывать запрос к модели.
+    cache_tag отличает ответы разных моделей и настроек в общем кэше.
+    """
+
+    cache_tag = ""
+
+    async def complete(self, messages: List[dict]) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        """
+        Ответ модели по частям (приращения текста). По умолчанию — один кусок
+        с полным ответом, для бэкендов без потоковой генерации.
+        """
+        yield await self.complete(messages)
+
+
+class YandexGPTBackend(LLMBackend):
+    """
+    YandexGPT через асинхронный клиент SDK: запрос не блокирует event loop,
+    а отмена задачи закрывает gRPC-вызов.
+    """
+
+    def __init__(self):
+        from yandex_cloud_ml_sdk import AsyncYCloudML
+
+        sdk = AsyncYCloudML(folder_id=MODEL_FOLDER_ID, auth=MODEL_AUTH_KEY)
+        self.model = sdk.models.completions(MODEL_NAME, model_version=MODEL_VERSION).configure(
+            temperature=MODEL_TEMPERATURE
+        )
+        self.cache_tag = f"yandex:{MODEL_NAME}/{MODEL_VERSION}:{MODEL_TEMPERATURE}"
+
+    async def complete(self, messages: List[dict]) -> str:
+        result = await self.model.run(messages, timeout=LLM_TIMEOUT)
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.labels("input").inc(usage.input_text_tokens)
+            LLM_TOKENS.labels("completion").inc(usage.completion_tokens)
+        if result and result.alternatives:
+            return result.alternatives[0].text
+        return "no model information"
+
+    async def stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        # run_stream отдаёт накопленный текст, клиенту нужны только приращения
+        text = ""
+        result = None
+        async for result in self.model.run_stream(messages, timeout=LLM_TIMEOUT):
+            if not result.alternatives:
+                continue
+            current = result.alternatives[0].text
+            if len(current) > len(text):
+                yield current[len(text):]
+                text = current
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.labels("input").inc(usage.input_text_tokens)
+            LLM_TOKENS.labels("completion").inc(usage.completion_tokens)
+
+
+class StubBackend(LLMBackend):
+    """
+    Локальная заглушка для нагрузочных тестов: ждёт latency ± 50% и возвращает
+    фиксированный ответ, не обращаясь к сети. С вероятностью error_rate вызов
+    завершается временной ошибкой, как при перегрузке сервиса.
+    """
+
+    def __init__(
+        self, latency: float = STUB_LLM_LATENCY, answer: str = STUB_LLM_ANSWER, error_rate: float = STUB_LLM_ERROR_RATE
+    ):
+        self.latency = latency
+        self.answer = answer
+        self.error_rate = error_rate
+        self.cache_tag = f"stub:{answer}"
+
+    async def complete(self, messages: List[dict]) -> str:
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.error_rate:
+            raise ConnectionError("stub LLM error")
+        # Токены заглушки — оценка по длине текста, чтобы метрики не были пустыми
+        LLM_TOKENS.labels("input").inc(sum(len(m["text"]) for m in messages) / CHARS_PER_TOKEN)
+        LLM_TOKENS.labels("completion").inc(len(self.answer) / CHARS_PER_TOKEN)
+        return self.answer
+
+    async def stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        text = await self.complete(messages)
+        for word in text.split(" "):
+            yield word + " "
+
+
+BACKENDS: Dict[str, Callable[[], LLMBackend]] = {
+    "yandex": YandexGPTBackend,
+    "stub": StubBackend,
+}
+
+# Бэкенд создаётся лениво и в каждом процессе свой: при gunicorn --preload
+# gRPC-канал SDK, открытый в мастере, после fork использовать нельзя
+_backend: Optional[LLMBackend] = None
+_backend_pid: Optional[int] = None
+# Одинаковые промпты, отправленные одновременно, уходят в модель один раз
+llm_flight = SingleFlight("run_model")
+
+
+def register_backend(name: str, factory: Callable[[], LLMBackend]) -> None:
+    BACKENDS[name] = factory
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Подменяет бэкенд процесса (None — вернуться к LLM_BACKEND из конфига)."""
+    global _backend, _backend_pid
+    _backend = backend
+    _backend_pid = os.getpid() if backend is not None else None
+
+
+def get_backend() -> LLMBackend:
+    global _backend, _backend_pid
+    if _backend is None or _backend_pid != os.getpid():
+        if LLM_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}")
+        _backend = BACKENDS[LLM_BACKEND]()
+        _backend_pid = os.getpid()
+    return _backend
+
+
+async def warm_up_backend() -> None:
+    """
+    Создаёт бэкенд заранее. Долгий импорт SDK идёт в потоке, а сам клиент
+    создаётся в потоке event loop, к которому привязываются его gRPC-каналы.
+    """
+    if LLM_BACKEND == "yandex":
+        await asyncio.to_thread(importlib.import_module, "yandex_cloud_ml_sdk")
+    get_backend()
+
+
+async def run_model(messages: list[dict], timeout: Optional[float] = None) -> str:
     """
     Принимает список сообщений в формате:
     [
@@ -16,11 +173,103 @@ async def run_model(messages: list[dict]) -> str:
       ...
     ]
     Возвращает текст первого ответа модели.
+
+    Число одновременных вызовов на процесс ограничивает адаптивный llm_limiter
+    (не больше LLM_MAX_CONCURRENCY), временные сбои повторяются. Если очередь
+    лимитера переполнена или цепь разомкнута, поднимается UpstreamUnavailable.
+    timeout (по умолчанию LLM_TIMEOUT, но не дольше дедлайна запроса) включает
+    ожидание в очереди и повторы; по его истечении вызов отменяется и
+    поднимается asyncio.TimeoutError.
+    Одновременные вызовы с одинаковыми messages разделяют один запрос к модели,
+    а готовые ответы берутся из общего для воркеров кэша (LLM_CACHE_TTL).
     """
     # logger.info(f"Отправляем сообщения в модель: {messages}")
-    result = model.run(messages)
-    if result and result.alternatives:
-        text = result.alternatives[0].text
-        # logger.info(f"Модель вернула:\n{text}")
-        return text
-    return "no model information"
+    backend = get_backend()
+    timeout = stage_timeout(timeout or LLM_TIMEOUT)
+    if timeout <= 0:
+        LLM_CALLS.labels("timeout").inc()
+        raise asyncio.TimeoutError()
+
+    key = messages_key(messages)
+    cache_key = f"{backend.cache_tag}:{key}"
+    if shared_cache is not None:
+        cached = await shared_cache.get("llm", cache_key)
+        if cached is not None:
+            return cached
+
+    async def _complete() -> str:
+        with INFLIGHT_LLM.track_inprogress():
+            return await backend.complete(messages)
+
+    async def _call() -> str:
+        result = await llm_limiter.call(_complete)
+        if shared_cache is not None:
+            await shared_cache.set("llm", cache_key, result, LLM_CACHE_TTL)
+        return result
+
+    try:
+        text = await asyncio.wait_for(llm_flight.do(key, _call), timeout=timeout)
+    except asyncio.TimeoutError:
+        LLM_CALLS.labels("timeout").inc()
+        logger.warning("LLM call timed out")
+        raise
+    except UpstreamUnavailable:
+        LLM_CALLS.labels("rejected").inc()
+        raise
+    except Exception:
+        LLM_CALLS.labels("error").inc()
+        raise
+    LLM_CALLS.labels("ok").inc()
+    # logger.info(f"Модель вернула:\n{text}")
+    return text
+
+
+async def run_model_stream(messages: List[dict], timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Потоковый вариант run_model: отдаёт ответ модели по частям по мере генерации.
+    Действуют тот же лимит одновременных вызовов и тот же таймаут (на весь
+    ответ, включая ожидание в очереди); одинаковые запросы не объединяются,
+    начатый ответ не повторяется.
+    """
+    backend = get_backend()
+    timeout = stage_timeout(timeout or LLM_TIMEOUT)
+    if timeout <= 0:
+        LLM_CALLS.labels("timeout").inc()
+        raise asyncio.TimeoutError()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    try:
+        probe = await asyncio.wait_for(llm_limiter.acquire(), timeout)
+    except asyncio.TimeoutError:
+        LLM_CALLS.labels("timeout").inc()
+        raise
+    except UpstreamUnavailable:
+        LLM_CALLS.labels("rejected").inc()
+        raise
+    chunks = backend.stream(messages)
+    outcome = None
+    try:
+        with INFLIGHT_LLM.track_inprogress():
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                yield chunk
+    except asyncio.TimeoutError:
+        # Ответ начат и не уложился в таймаут — признак перегрузки модели
+        LLM_CALLS.labels("timeout").inc()
+        logger.warning("LLM stream timed out")
+        outcome = "transient"
+        raise
+    except Exception as e:
+        LLM_CALLS.labels("error").inc()
+        outcome = "transient" if is_transient(e) else "error"
+        raise
+    else:
+        LLM_CALLS.labels("ok").inc()
+        outcome = "ok"
+    finally:
+        await chunks.aclose()
+        llm_limiter.release(outcome, probe)
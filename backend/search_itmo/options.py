@@ -0,0 +1,107 @@
+import json
+import re
+from typing import List, Optional, Tuple
+
+# Строка варианта ответа: "1. ...", "2) ...", "3 - ..."
+OPTION_RE = re.compile(r"^\s*(\d+)\s*[.)\]:\-]\s*")
+
+
+def split_options(query: str) -> Tuple[str, List[str]]:
+    """
+    Делит вопрос на текст и варианты ответа (в порядке нумерации строк).
+    Строки, не похожие на вариант, остаются в тексте вопроса.
+    """
+    question_lines: List[str] = []
+    options: List[str] = []
+    for line in query.replace("\r", "\n").split("\n"):
+        match = OPTION_RE.match(line)
+        if match and line[match.end():].strip():
+            options.append(line[match.end():].strip())
+        elif line.strip():
+            question_lines.append(line.strip())
+    return " ".join(question_lines), options
+
+
+def has_options(query: str) -> bool:
+    """Есть ли в вопросе хотя бы два пронумерованных варианта ответа."""
+    return len(split_options(query)[1]) >= 2
+
+
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+# Ограда ```json ... ``` вокруг ответа (закрывающей может не быть, если ответ обрезан)
+_FENCE_OPEN_RE = re.compile(r"^```(?:json\b)?", re.IGNORECASE)
+_ANSWER_FIELD_RE = re.compile(r"[\"']?(?:answer|variant|ответ|вариант)[\"']?\s*[:=]\s*[\"']?(\d+|null)", re.IGNORECASE)
+# Свободный текст без двоеточия: "Правильный ответ 2", "ответ — вариант 3"
+_ANSWER_TEXT_RE = re.compile(r"\b(?:answer|ответ)(?:\s+is)?[\s\-—–]*(?:(?:вариант|variant|номер|№)\s*)?(\d+)\b", re.IGNORECASE)
+_REASONING_FIELD_RE = re.compile(r"[\"']?(?:reasoning|пояснение)[\"']?\s*[:=]\s*\"((?:[^\"\\]|\\.)*)\"?", re.IGNORECASE | re.DOTALL)
+_LEADING_NUMBER_RE = re.compile(r"^\s*(\d+)\b", re.MULTILINE)
+
+
+def _valid_variant(value, n_options: int) -> Optional[int]:
+    # true/false и дробные номера — не номер варианта, а ошибка модели
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        variant = int(value)
+    except (TypeError, ValueError):
+        return None
+    if n_options and not 1 <= variant <= n_options:
+        return None
+    return variant
+
+
+def parse_structured_answer(raw: str, n_options: int) -> Tuple[Optional[int], str]:
+    """
+    Разбирает ответ модели вида {"answer": 3, "reasoning": "..."}.
+    Если JSON испорчен (обёрнут в ```, обрезан, с лишним текстом), номер и
+    пояснение достаются регулярными выражениями; в крайнем случае номером
+    считается первое число в начале строки, а пояснением — весь текст.
+    Номер вне диапазона 1..n_options отбрасывается.
+    """
+    text = _FENCE_OPEN_RE.sub("", raw.strip()).strip("`")
+
+    match = _JSON_RE.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            variant = _valid_variant(data.get("answer"), n_options)
+            reasoning = str(data.get("reasoning") or "").strip()
+            return variant, reasoning or text.strip()
+
+    variant = None
+    field = _ANSWER_FIELD_RE.search(text) or _ANSWER_TEXT_RE.search(text)
+    if field:
+        variant = _valid_variant(field.group(1), n_options)
+    else:
+        number = _LEADING_NUMBER_RE.search(text)
+        if number:
+            variant = _valid_variant(number.group(1), n_options)
+
+    reasoning_match = _REASONING_FIELD_RE.search(text)
+    if reasoning_match:
+        reasoning = reasoning_match.group(1).replace('\\"', '"').strip()
+    else:
+        reasoning = text.strip()
+    return variant, reasoning
+
+
+_CONFIDENCE_FIELD_RE = re.compile(r"[\"']?(?:confidence|уверенность)[\"']?\s*[:=]\s*[\"']?(\d+(?:[.,]\d+)?)", re.IGNORECASE)
+
+
+def parse_confidence(raw: str) -> float:
+    """
+    Уверенность из ответа модели ("confidence": 0.85 или 85 — в процентах).
+    Процентами считаются целые числа от 2 до 100 и любые от 10 до 100;
+    остальное (1.5, 250) просто обрезается до 0..1. Если поля нет или его
+    не разобрать — 0, то есть "не уверена".
+    """
+    match = _CONFIDENCE_FIELD_RE.search(raw)
+    if not match:
+        return 0.0
+    value = float(match.group(1).replace(",", "."))
+    if 1 < value <= 100 and (value.is_integer() or value >= 10):
+        value /= 100
+    return min(max(value, 0.0), 1.0)
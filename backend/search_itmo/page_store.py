@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .cache import open_sqlite
+from .config import PAGE_STORE_PATH, PAGE_STORE_MAX_BYTES, PAGE_STORE_TOUCH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class PageStore:
+    """
+    Дисковое хранилище страниц по URL (SQLite): извлечённый текст с
+    нормализованными пробелами, ETag/Last-Modified для условных запросов и
+    время загрузки. Там же хранятся LLM-выжимки страниц по хэшу содержимого.
+    При превышении max_bytes удаляются записи, к которым дольше всего не обращались.
+    Время обращения обновляется не чаще раза в touch_interval секунд на запись:
+    иначе каждое попадание было бы записью в WAL, общей для всех воркеров,
+    а для вытеснения такой точности хватает.
+    """
+
+    EVICT_EVERY = 50
+
+    def __init__(self, path: str, max_bytes: int, touch_interval: float = PAGE_STORE_TOUCH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, text TEXT, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL, accessed_at REAL, size INTEGER)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "hash TEXT PRIMARY KEY, summary TEXT, accessed_at REAL, size INTEGER)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _get_page(self, url: str) -> Optional[dict]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT text, etag, last_modified, fetched_at, accessed_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and now - (row[4] or 0) >= self.touch_interval:
+                conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url))
+        if row is None:
+            return None
+        return {"text": row[0], "etag": row[1], "last_modified": row[2], "fetched_at": row[3]}
+
+    def _put_page(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO pages "
+                "(url, text, etag, last_modified, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, text, etag, last_modified, now, now, len(text.encode("utf-8"))),
+            )
+        self._after_write()
+
+    def _touch_page(self, url: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+
+    def _get_summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT summary, accessed_at FROM summaries WHERE hash = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - (row[1] or 0) >= self.touch_interval:
+                conn.execute("UPDATE summaries SET accessed_at = ? WHERE hash = ?", (now, key))
+        return row[0] if row else None
+
+    def _put_summary(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO summaries (hash, summary, accessed_at, size) VALUES (?, ?, ?, ?)",
+                (key, summary, time.time(), len(summary.encode("utf-8"))),
+            )
+        self._after_write()
+
+    def _after_write(self) -> None:
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные записи, пока объём не станет меньше 90% лимита."""
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute(
+                "SELECT COALESCE((SELECT SUM(size) FROM pages), 0) + "
+                "COALESCE((SELECT SUM(size) FROM summaries), 0)"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            target = int(self.max_bytes * 0.9)
+            rows = conn.execute(
+                "SELECT 'pages', url, size, accessed_at FROM pages "
+                "UNION ALL SELECT 'summaries', hash, size, accessed_at FROM summaries "
+                "ORDER BY accessed_at"
+            ).fetchall()
+            removed = 0
+            for table, key, size, _ in rows:
+                if total <= target:
+                    break
+                column = "url" if table == "pages" else "hash"
+                conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+                total -= size
+                removed += 1
+        logger.info(f"Page store eviction: removed {removed} entries")
+
+    def _open(self) -> None:
+        with self._lock:
+            self._connect()
+
+    async def connect(self) -> None:
+        """Открывает файл и создаёт таблицы заранее (прогрев воркера)."""
+        await asyncio.to_thread(self._open)
+
+    async def get_page(self, url: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get_page, url)
+
+    async def put_page(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        await asyncio.to_thread(self._put_page, url, text, etag, last_modified)
+
+    async def touch_page(self, url: str) -> None:
+        await asyncio.to_thread(self._touch_page, url)
+
+    async def get_summary(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get_summary, key)
+
+    async def put_summary(self, key: str, summary: str) -> None:
+        await asyncio.to_thread(self._put_summary, key, summary)
+
+
+page_store: Optional[PageStore] = PageStore(PAGE_STORE_PATH, PAGE_STORE_MAX_BYTES) if PAGE_STORE_PATH else None
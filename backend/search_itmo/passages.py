@@ -0,0 +1,91 @@
+import re
+from typing import List
+
+import numpy as np
+
+from .config import (
+    KEYWORDS,
+    PASSAGE_TOKEN_BUDGET,
+    PASSAGE_QUERY_WEIGHT,
+    PASSAGE_MAX_CHARS,
+    CHARS_PER_TOKEN,
+)
+from .local_index import Tokenizer
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+_SOURCE_RE = re.compile(r"!!!SOURCE: .*?!!!")
+
+_tokenizer = Tokenizer()
+_keyword_terms = frozenset(_tokenizer(KEYWORDS))
+
+
+def split_sentences(text: str, max_chars: int = 400) -> List[str]:
+    """
+    Делит текст на предложения. Слишком длинные куски без знаков препинания
+    (меню, таблицы) режутся на окна по max_chars по границам слов.
+    """
+    sentences = []
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def estimate_tokens(text: str) -> float:
+    return len(text) / CHARS_PER_TOKEN
+
+
+def select_passages(text: str, query: str = "", budget: int = PASSAGE_TOKEN_BUDGET) -> str:
+    """
+    Выбирает из текста страницы предложения, лучше всего совпадающие со словами
+    вопроса (вес PASSAGE_QUERY_WEIGHT) и config.KEYWORDS (вес 1), пока не
+    исчерпан бюджет в токенах. Предложения возвращаются в исходном порядке.
+    Пустая строка — если ни одно предложение не совпало.
+    """
+    text = _SOURCE_RE.sub(" ", text[:PASSAGE_MAX_CHARS])
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+
+    query_terms = sorted(set(_tokenizer(query)))
+    keyword_terms = sorted(_keyword_terms.difference(query_terms))
+    vocab = {term: i for i, term in enumerate(query_terms + keyword_terms)}
+    weights = np.concatenate([
+        np.full(len(query_terms), PASSAGE_QUERY_WEIGHT, dtype=np.float32),
+        np.ones(len(keyword_terms), dtype=np.float32),
+    ])
+
+    # Матрица "предложение x термин": 1, если термин встречается в предложении
+    rows: List[int] = []
+    cols: List[int] = []
+    for i, sentence in enumerate(sentences):
+        for j in {vocab[t] for t in _tokenizer(sentence) if t in vocab}:
+            rows.append(i)
+            cols.append(j)
+    if not rows:
+        return ""
+    matches = np.zeros((len(sentences), len(vocab)), dtype=np.float32)
+    matches[rows, cols] = 1.0
+
+    lengths = np.fromiter((len(s) for s in sentences), dtype=np.float32, count=len(sentences))
+    costs = lengths / CHARS_PER_TOKEN
+    # Длинные предложения слегка штрафуем, чтобы бюджет не уходил на одно
+    scores = (matches @ weights) / np.sqrt(np.maximum(lengths, 100.0) / 100.0)
+
+    chosen: List[int] = []
+    used = 0.0
+    for i in np.argsort(-scores, kind="stable"):
+        if scores[i] <= 0:
+            break
+        if used + costs[i] > budget:
+            continue
+        chosen.append(int(i))
+        used += float(costs[i])
+    return " ".join(sentences[i] for i in sorted(chosen))
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .admission import Ticket, admission
+from .cache import answer_cache, query_key
+from .config import (
+    ANSWER_MODE,
+    BATCH_CONCURRENCY,
+    COMPRESS_PIPELINED,
+    KNOWLEDGE_MODE,
+    KNOWLEDGE_MIN_CONFIDENCE,
+    KNOWLEDGE_TIMEOUT,
+    LOCAL_INDEX_ENABLED,
+    MAX_SOURCES,
+    ANSWER_RESERVE,
+    RETRIEVAL_MIN_TIME,
+    SINGLEFLIGHT_ENABLED,
+    SEARCH_BUDGET,
+    VARIANT_MIN_TIME,
+)
+from .deadline import has_time, skip, skipped_stages, stage_timeout, start_request
+from .events import emit, start_events
+from .limiter import UpstreamUnavailable
+from .metrics import KNOWLEDGE_ANSWERS, timed
+from .options import has_options
+from .semantic_cache import semantic_cache
+from .services import (
+    search_links,
+    fetch_page_texts,
+    compress_pages_for_itmo,
+    fetch_and_compress_pages,
+    ask_explanation,
+    ask_which_variant,
+    ask_answer,
+    ask_closed_book,
+    retrieve_local,
+)
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Одновременные одинаковые (после нормализации) вопросы считаются один раз
+request_flight = SingleFlight("request")
+# Билет допуска общего вычисления и число запросов, ждущих его в request_flight
+_flight_tickets: Dict[str, List[Any]] = {}
+
+
+async def retrieve_context(query: str):
+    """
+    Ссылки и контекст для ответа с учётом дедлайна: если на поиск не остаётся
+    времени, ответ строится на знаниях модели (пустой контекст).
+    """
+    local = None
+    if LOCAL_INDEX_ENABLED:
+        with timed("local_index"):
+            local = await retrieve_local(query)
+    if local is not None:
+        emit("sources", {"sources": local[0]})
+        return local
+
+    if not has_time(RETRIEVAL_MIN_TIME, ANSWER_RESERVE):
+        skip("search")
+        return [], ""
+
+    # Шаги 1-2: Получаем гугл-запрос и идём в Google (через другое api,
+    # потому что у этого ограничений больше); см. SEARCH_MODE
+    try:
+        with timed("search"):
+            links = await asyncio.wait_for(search_links(query), stage_timeout(SEARCH_BUDGET, ANSWER_RESERVE))
+    except (asyncio.TimeoutError, UpstreamUnavailable):
+        skip("search")
+        return [], ""
+
+    # Шаг 3: Скачиваем тексты, сжимаем до нужных частей. Кандидатов из поиска
+    # больше, чем страниц в контексте (см. iter_page_texts): источниками
+    # считаются только загруженные страницы, из которых собран контекст
+    if COMPRESS_PIPELINED:
+        used, big_context = await fetch_and_compress_pages(links, query)
+    else:
+        pages = await fetch_page_texts(links)
+        used = [idx for idx, _ in pages]
+        big_context = await compress_pages_for_itmo(
+            [text for _, text in pages], query, urls=[links[idx] for idx in used]
+        )
+    sources = [links[idx] for idx in used][:MAX_SOURCES]
+    emit("sources", {"sources": sources})
+    return sources, big_context
+
+
+async def closed_book_answer(query: str) -> Optional[dict]:
+    """
+    Ответ "по памяти" (KNOWLEDGE_MODE): принимается, только если модель уверена
+    не меньше KNOWLEDGE_MIN_CONFIDENCE и, когда варианты есть, выбрала один из них.
+    Иначе — None, и вопрос уходит в полный конвейер с поиском. Ответ по памяти
+    необязателен: любая его ошибка (кроме отмены) тоже ведёт к поиску.
+    """
+    try:
+        with timed("closed_book"):
+            variant, reasoning, confidence = await asyncio.wait_for(
+                ask_closed_book(query), stage_timeout(KNOWLEDGE_TIMEOUT, ANSWER_RESERVE)
+            )
+    except (asyncio.TimeoutError, UpstreamUnavailable):
+        KNOWLEDGE_ANSWERS.labels("failed").inc()
+        return None
+    except Exception as e:
+        logger.error(f"Closed-book answer failed, falling back to retrieval: {type(e).__name__}: {e}")
+        KNOWLEDGE_ANSWERS.labels("failed").inc()
+        return None
+
+    accepted = confidence >= KNOWLEDGE_MIN_CONFIDENCE and (variant is not None or not has_options(query))
+    KNOWLEDGE_ANSWERS.labels("accepted" if accepted else "escalated").inc()
+    emit("closed_book", {"answer": variant, "confidence": confidence, "accepted": accepted})
+    logger.info(f"Closed-book answer {variant} with confidence {confidence:.2f}: {'accepted' if accepted else 'escalated'}")
+    if not accepted:
+        return None
+    return {
+        "answer": variant,
+        "reasoning": reasoning + "\n Ответ сгенерирован yandexgpt-32k/rc без поиска",
+        "sources": [],
+        "skipped_stages": skipped_stages(),
+        "closed_book": True,
+    }
+
+
+async def _retrieve_after_closed_book(query: str) -> Tuple[Optional[dict], Tuple[List[str], str]]:
+    """
+    Сначала ответ по памяти, поиск — только если он не принят. В режиме
+    "parallel" поиск запускается сразу и отменяется при уверенном ответе:
+    неуверенные вопросы не ждут лишний вызов модели, зато поиск тратится зря.
+    """
+    if KNOWLEDGE_MODE != "parallel":
+        result = await closed_book_answer(query)
+        if result is not None:
+            return result, ([], "")
+        return None, await retrieve_context(query)
+
+    retrieval = asyncio.create_task(retrieve_context(query))
+    try:
+        result = await closed_book_answer(query)
+        if result is not None:
+            return result, ([], "")
+        return None, await retrieval
+    finally:
+        if not retrieval.done():
+            retrieval.cancel()
+            await asyncio.gather(retrieval, return_exceptions=True)
+
+
+async def answer_query(query: str) -> dict:
+    """
+    Полный конвейер ответа на вопрос: переформулировка -> поиск -> загрузка
+    и сжатие страниц -> пояснение -> выбор варианта. Если локальный индекс
+    уверенно находит ответ, первые три шага заменяются его пассажами.
+    С KNOWLEDGE_MODE сначала пробуется ответ по памяти (closed_book_answer).
+    Этапы, пропущенные из-за дедлайна запроса, перечислены в "skipped_stages".
+    Возвращает {"answer", "reasoning", "sources", "skipped_stages"} без id
+    запроса, чтобы результат можно было кэшировать и переиспользовать.
+    """
+    if KNOWLEDGE_MODE in ("sequential", "parallel"):
+        result, (links, big_context) = await _retrieve_after_closed_book(query)
+        if result is not None:
+            return result
+    else:
+        links, big_context = await retrieve_context(query)
+
+    try:
+        if ANSWER_MODE == "single":
+            # Шаг 4: номер варианта и пояснение одним вызовом
+            with timed("answer"):
+                chosen_variant, explanation = await ask_answer(query, big_context)
+        else:
+            # Шаг 4: всегда спрашиваем "пояснение"
+            with timed("explanation"):
+                explanation = await ask_explanation(query, big_context)
+
+            # Без пронумерованных вариантов выбирать нечего — лишний вызов не делаем
+            chosen_variant = None
+            if has_options(query):
+                try:
+                    if not has_time(VARIANT_MIN_TIME):
+                        raise asyncio.TimeoutError()
+                    with timed("variant"):
+                        chosen_variant = await ask_which_variant(query, explanation)
+                    emit("variant", {"answer": chosen_variant})
+                except (asyncio.TimeoutError, UpstreamUnavailable):
+                    skip("variant")
+    except asyncio.TimeoutError:
+        skip("answer")
+        return {
+            "answer": None,
+            "reasoning": "Не удалось получить ответ модели за отведённое время",
+            "sources": list(links),
+            "skipped_stages": skipped_stages(),
+        }
+
+    return {
+        "answer": chosen_variant,
+        "reasoning": explanation + "\n Ответ сгенерирован yandexgpt-32k/rc",
+        "sources": list(links),
+        "skipped_stages": skipped_stages(),
+    }
+
+
+async def _compute_and_store(query: str) -> dict:
+    result = await answer_query(query)
+    # Ответы без источников (поиск не сработал) и урезанные из-за дедлайна
+    # не кэшируем, чтобы не закреплять деградировавший результат на весь TTL.
+    # Уверенный ответ по памяти источников не имеет, но кэшируется
+    if (result["sources"] or result.get("closed_book")) and not result["skipped_stages"]:
+        if answer_cache is not None:
+            await answer_cache.set(query, result)
+        if semantic_cache is not None:
+            semantic_cache.set(query, result)
+    return result
+
+
+async def cached_answer(query: str) -> Optional[dict]:
+    """Готовый ответ из кэша: сначала точное совпадение вопроса, затем по смыслу."""
+    result: Optional[dict] = await answer_cache.get(query) if answer_cache is not None else None
+    if result is None and semantic_cache is not None:
+        if answer_cache is not None:
+            semantic_cache.sync_generation(answer_cache.generation)
+        result = semantic_cache.get(query)
+    return result
+
+
+async def _admitted_compute(query: str, ticket: Ticket) -> dict:
+    # Место в очереди допуска занимает только реально считаемый вопрос:
+    # ответы из кэша и ожидающие одинакового запроса проходят без очереди
+    async with admission.slot(ticket=ticket):
+        return await _compute_and_store(query)
+
+
+async def get_answer(query: str, priority: str = "normal") -> dict:
+    """
+    Ответ на вопрос с учётом кэша и объединения одновременных одинаковых запросов.
+    Результат общий для всех ожидающих, id запроса подставляет вызывающий.
+    Если воркер перегружен, бросает Overloaded (см. AdmissionController).
+    """
+    result = await cached_answer(query)
+    if result is not None:
+        return result
+    if not SINGLEFLIGHT_ENABLED:
+        return await _admitted_compute(query, Ticket(priority))
+
+    # Вычисление общее для одинаковых вопросов, и в очереди допуска оно стоит
+    # с классом самого важного из ожидающих: interactive, присоединившийся к
+    # batch-вопросу, не ждёт за пакетной нагрузкой и не вытесняется вместе с ней
+    key = query_key(query)
+    entry = _flight_tickets.get(key)
+    if entry is None:
+        entry = _flight_tickets[key] = [Ticket(priority), 0]
+    else:
+        admission.promote(entry[0], priority)
+    entry[1] += 1
+    try:
+        return await request_flight.do(key, lambda: _admitted_compute(query, entry[0]))
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and _flight_tickets.get(key) is entry:
+            del _flight_tickets[key]
+
+
+async def stream_answer(query: str, priority: str = "normal") -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Потоковый get_answer: отдаёт события этапов (query, summary, sources,
+    token, variant) по мере готовности и последним — ("result", результат
+    answer_query). Запрос выполняется в отдельной задаче без объединения
+    с одинаковыми: если клиент отключился и генератор закрыт, задача отменяется.
+    """
+    cached = await cached_answer(query)
+    if cached is not None:
+        yield "result", cached
+        return
+
+    queue = start_events()
+    task = asyncio.create_task(_admitted_compute(query, Ticket(priority)))
+    getter: Optional[asyncio.Future] = None
+    try:
+        while not task.done() or not queue.empty():
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        yield "result", task.result()
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def iter_batch_answers(
+    queries: List[str],
+    timeout: Optional[float] = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    priority: str = "batch",
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Ответы на пачку вопросов в порядке входа: пары (индекс, результат get_answer
+    или исключение). Одинаковые после нормализации вопросы считаются один раз;
+    одновременно обрабатывается не больше concurrency вопросов, и поиск,
+    страницы и промпты у них общие через singleflight и хранилище страниц.
+    Дедлайн timeout отсчитывается для каждого вопроса с момента его запуска.
+    По умолчанию вопросы пачки пропускают вперёд обычные запросы (priority="batch").
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _answer(query: str) -> dict:
+        async with semaphore:
+            start_request(timeout)
+            return await get_answer(query, priority)
+
+    unique: Dict[str, asyncio.Task] = {}
+    tasks: List[asyncio.Task] = []
+    for query in queries:
+        key = query_key(query)
+        if key not in unique:
+            unique[key] = asyncio.create_task(_answer(query))
+        tasks.append(unique[key])
+    logger.info(f"Batch of {len(queries)} questions, {len(unique)} unique")
+
+    try:
+        for idx, task in enumerate(tasks):
+            try:
+                yield idx, await asyncio.shield(task)
+            except Exception as e:
+                yield idx, e
+    finally:
+        for task in unique.values():
+            task.cancel()
+        await asyncio.gather(*unique.values(), return_exceptions=True)
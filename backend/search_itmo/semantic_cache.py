@@ -0,0 +1,230 @@
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_DIM,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_THRESHOLD_NO_OPTIONS,
+    SEMANTIC_CACHE_MAX_UNMATCHED_WEIGHT,
+    ANSWER_CACHE_TTL,
+    LOCAL_INDEX_ENABLED,
+)
+from .local_index import Tokenizer, get_local_index
+from .metrics import CACHE_LOOKUPS
+from .options import split_options
+
+_NUMBER_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RE = re.compile(r"\s+")
+
+_tokenizer = Tokenizer()
+
+# Слова, которыми формулировки одного вопроса обычно и различаются: вопросительные
+# обороты и «университет» вместо названия ИТМО. Без локального индекса (idf) их вес
+# в векторе снижен до QUESTION_WORD_WEIGHT, остальных слов — 1
+_QUESTION_WORDS = frozenset(_tokenizer(
+    "какое каков какова каково количество число имеет имеют имеется есть является "
+    "называется назовите укажите университет университета университете вуз вуза вузе"
+))
+QUESTION_WORD_WEIGHT = 0.3
+
+
+def term_weights(terms: Sequence[str]) -> List[float]:
+    """
+    Вес слова в векторе вопроса: idf по локальному индексу относительно idf
+    слова, которого нет в корпусе (частые в корпусе слова вроде «итмо» или
+    «студент» весят мало, редкие уточнения — почти 1). Без индекса —
+    QUESTION_WORD_WEIGHT для вопросительных оборотов и 1 для остальных слов.
+    """
+    index = get_local_index() if LOCAL_INDEX_ENABLED else None
+    if index is None:
+        return [QUESTION_WORD_WEIGHT if term in _QUESTION_WORDS else 1.0 for term in terms]
+    top = index.idf(0)
+    return [index.idf(index.terms[term][0]) / top if term in index.terms else 1.0 for term in terms]
+
+
+def key_terms(question: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    То, что в перефразированном вопросе меняться не может: числа и названия —
+    аббревиатуры (ИТМО, МГУ, ICPC) и слова с заглавной буквы не в начале
+    предложения, кроме вопросительных оборотов («Университет ИТМО»).
+    """
+    numbers = tuple(sorted(set(_NUMBER_RE.findall(question))))
+    names = set()
+    for match in _WORD_RE.finditer(question):
+        word = match.group()
+        if word.isdigit() or not word[0].isupper():
+            continue
+        before = question[:match.start()].rstrip()
+        acronym = sum(1 for ch in word if ch.isupper()) >= 2
+        if acronym or (before and before[-1] not in ".!?"):
+            names.update(term for term in _tokenizer(word) if term not in _QUESTION_WORDS)
+    return numbers, tuple(sorted(names))
+
+
+def embed(terms: Sequence[str], weights: Optional[Sequence[float]] = None, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """
+    Вектор из хэшированных признаков: основы слов и их символьные 3- и
+    4-граммы, с весом слова (term_weights). Знак признака тоже берётся из
+    хэша, чтобы коллизии в среднем гасили друг друга. Норма — 1.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for i, term in enumerate(terms):
+        weight = weights[i] if weights is not None else 1.0
+        padded = f" {term} "
+        features = [f"w:{term}"]
+        for n in (3, 4):
+            features.extend(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def _normalize_option(option: str) -> str:
+    return _SPACE_RE.sub(" ", option.lower().replace("ё", "е")).strip(" .;")
+
+
+class SemanticCache:
+    """
+    Кэш ответов по смыслу вопроса: перефразированный вопрос с теми же
+    вариантами ответа получает уже готовый результат. Векторы вопросов (без
+    вариантов, слова взвешены по idf) лежат в матрице фиксированного размера
+    capacity x dim, поиск — скалярное произведение со всеми строками. Ответ
+    переиспользуется, если сходство не ниже порога, а слова, которые есть
+    только в одном из вопросов, частые (вес не больше max_unmatched_weight):
+    «какое количество» или «университет» допустимы, новое редкое слово
+    («иностранных студентов») — нет, даже если в длинном вопросе оно почти
+    не меняет сходство. Кроме того, должны совпасть набор вариантов (при
+    другом порядке номер ответа пересчитывается), числа и названия в вопросе
+    (key_terms): другой вуз — уже другой вопрос.
+    При заполнении вытесняется давно не использованная запись.
+    """
+
+    def __init__(
+        self,
+        capacity: int = SEMANTIC_CACHE_SIZE,
+        dim: int = SEMANTIC_CACHE_DIM,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        threshold_no_options: float = SEMANTIC_CACHE_THRESHOLD_NO_OPTIONS,
+        max_unmatched_weight: float = SEMANTIC_CACHE_MAX_UNMATCHED_WEIGHT,
+        ttl: float = ANSWER_CACHE_TTL,
+    ):
+        self.capacity = max(capacity, 1)
+        self.dim = dim
+        self.threshold = threshold
+        self.threshold_no_options = threshold_no_options
+        self.max_unmatched_weight = max_unmatched_weight
+        self.ttl = ttl
+        self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+        # Для каждой строки матрицы: (варианты, (числа, названия), веса слов, результат, срок годности)
+        self._entries: List[Optional[Tuple[Tuple[str, ...], tuple, Dict[str, float], dict, float]]] = (
+            [None] * self.capacity
+        )
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._size = 0
+        self._generation = 0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+    def sync_generation(self, generation: int) -> None:
+        """Сбрасывает кэш, если кэш ответов инвалидировали (возможно, в другом воркере)."""
+        if generation != self._generation:
+            self._generation = generation
+            self.invalidate()
+
+    def _key(self, query: str) -> Tuple[np.ndarray, Tuple[str, ...], tuple, Dict[str, float]]:
+        question, options = split_options(query)
+        question = question or query
+        terms = _tokenizer(question)
+        weights = term_weights(terms)
+        options_key = tuple(_normalize_option(o) for o in options)
+        return embed(terms, weights, self.dim), options_key, key_terms(question), dict(zip(terms, weights))
+
+    def _unmatched_weight(self, weights: Dict[str, float], cached_weights: Dict[str, float]) -> float:
+        """Наибольший вес слова, которое есть только в одном из двух вопросов."""
+        unmatched = [weights[t] for t in weights.keys() - cached_weights.keys()]
+        unmatched += [cached_weights[t] for t in cached_weights.keys() - weights.keys()]
+        return max(unmatched, default=0.0)
+
+    def _candidates(self, vector: np.ndarray, threshold: float) -> np.ndarray:
+        if not self._size:
+            return np.empty(0, dtype=np.int64)
+        scores = self._vectors[:self._size] @ vector
+        idx = np.nonzero(scores >= threshold)[0]
+        return idx[np.argsort(-scores[idx])]
+
+    def get(self, query: str) -> Optional[dict]:
+        vector, options, keys, weights = self._key(query)
+        threshold = self.threshold if options else self.threshold_no_options
+        now = time.monotonic()
+        for i in self._candidates(vector, threshold):
+            entry = self._entries[i]
+            if entry is None or entry[4] < now:
+                continue
+            cached_options, cached_keys, cached_weights, result, _ = entry
+            if cached_keys != keys or sorted(cached_options) != sorted(options):
+                continue
+            if self._unmatched_weight(weights, cached_weights) > self.max_unmatched_weight:
+                continue
+            self._last_used[i] = now
+            self.stats["hits"] += 1
+            CACHE_LOOKUPS.labels("semantic", "hit").inc()
+            return self._remap(result, cached_options, options)
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.labels("semantic", "miss").inc()
+        return None
+
+    @staticmethod
+    def _remap(result: dict, cached_options: Tuple[str, ...], options: Tuple[str, ...]) -> dict:
+        # Те же варианты в другом порядке: номер ответа указывает на текст варианта
+        answer = result.get("answer")
+        if cached_options == options or not isinstance(answer, int) or not 1 <= answer <= len(cached_options):
+            return result
+        return {**result, "answer": options.index(cached_options[answer - 1]) + 1}
+
+    def set(self, query: str, result: dict) -> None:
+        vector, options, keys, weights = self._key(query)
+        if not vector.any():
+            return
+        now = time.monotonic()
+        same = [
+            i for i in self._candidates(vector, 0.999)
+            if self._entries[i] is not None and self._entries[i][:2] == (options, keys)
+        ]
+        if same:
+            slot = int(same[0])
+        elif self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+            self.stats["evictions"] += 1
+        self._vectors[slot] = vector
+        self._entries[slot] = (options, keys, weights, result, now + self.ttl)
+        self._last_used[slot] = now
+        self.stats["sets"] += 1
+
+    def invalidate(self) -> None:
+        self._entries = [None] * self.capacity
+        self._last_used[:] = 0
+        self._size = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "size": self._size,
+            "capacity": self.capacity,
+            "memory_bytes": int(self._vectors.nbytes),
+        }
+
+
+semantic_cache: Optional[SemanticCache] = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
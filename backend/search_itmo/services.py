@@ -1,13 +1,53 @@
+import codecs
 import logging
 import re
+import time
 
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 from urllib.parse import quote_plus
-from .config import SEARCH_API_KEY, SEARCH_URL
-from .model import run_model
+from .config import (
+    SEARCH_API_KEY,
+    SEARCH_URL,
+    COMPRESS_CONCURRENCY,
+    PAGE_STORE_FRESH_TTL,
+    PAGE_REFRESH_TIMEOUT,
+    PAGE_STREAMING,
+    PAGE_MAX_BYTES,
+    PAGE_CHUNK_SIZE,
+    PAGE_TEXT_TARGET_CHARS,
+    PAGE_CONTENT_TYPES,
+    LOCAL_INDEX_MIN_CONFIDENCE,
+    LOCAL_INDEX_TOP_K,
+    MAX_SOURCES,
+    PASSAGE_SELECTION,
+    SEARCH_MODE,
+    SPECULATIVE_MIN_URLS,
+    SEARCH_RESULTS,
+    FETCH_PAGES,
+    FETCH_PARALLEL,
+    ANSWER_RESERVE,
+    SERPSTACK_TIMEOUT,
+    SEARCH_CACHE_TTL,
+    PAGE_FETCH_TIMEOUT,
+    COMPRESS_TIMEOUT,
+    COMPRESS_MIN_TIME,
+)
+from .deadline import skip, stage_timeout
+from .events import emit, streaming
+from .extract import extract_text, TextEstimator
+from .host_stats import host_of, host_stats
+from .http_client import detect_charset, get_http_session
+from .limiter import UpstreamHTTPError, UpstreamUnavailable, search_limiter
+from .local_index import get_local_index
+from .metrics import CACHE_LOOKUPS, FETCH_BYTES, FETCH_HEDGES, INFLIGHT_FETCHES, PAGES_FETCHED, timed
+from .model import run_model, run_model_stream
+from .options import split_options, parse_confidence, parse_structured_answer
+from .page_store import page_store, content_hash
+from .passages import select_passages
+from .shared_cache import shared_cache
+from .singleflight import singleflight
 
 logger = logging.getLogger("uvicorn")
 
@@ -17,6 +57,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Текущие загрузки страниц по URL (в том числе фоновые обновления)
+_downloads: Dict[str, asyncio.Task] = {}
+
 
 async def transform_query_for_google(original_query: str) -> str:
     system_msg = {
@@ -35,114 +78,406 @@ async def transform_query_for_google(original_query: str) -> str:
     }
     user_msg = {"role": "user", "text": original_query}
     messages = [system_msg, assistant_msg, user_msg]
-    result = await run_model(messages)
-    return result.strip() or original_query
-
-
+    try:
+        with timed("rewrite"):
+            result = await run_model(messages)
+    except UpstreamUnavailable:
+        # Модель перегружена — ищем по исходному вопросу
+        skip("rewrite")
+        return original_query
+    refined = result.strip() or original_query
+    emit("query", {"query": refined})
+    return refined
+
+
+async def retrieve_local(query: str) -> Optional[Tuple[List[str], str]]:
+    """
+    Ищет ответ в локальном BM25-индексе по тексту вопроса (без вариантов).
+    Возвращает (ссылки, контекст из пассажей с маркерами !!!SOURCE) или None,
+    если индекса нет или уверенность ниже LOCAL_INDEX_MIN_CONFIDENCE.
+    В контекст попадают пассажи не более чем MAX_SOURCES страниц. Загрузка
+    индекса и поиск идут в пуле потоков, чтобы не блокировать event loop.
+    """
+    return await asyncio.to_thread(_retrieve_local, query)
+
+
+def _retrieve_local(query: str) -> Optional[Tuple[List[str], str]]:
+    index = get_local_index()
+    if index is None:
+        return None
+    question, _ = split_options(query)
+    hits, confidence = index.search(question or query, LOCAL_INDEX_TOP_K)
+    if not hits or confidence < LOCAL_INDEX_MIN_CONFIDENCE:
+        logger.info(f"Local index confidence {confidence:.2f}, falling back to web search")
+        return None
+    urls = list(dict.fromkeys(hit.url for hit in hits))[:MAX_SOURCES]
+    hits = [hit for hit in hits if hit.url in urls]
+    links = [url for url in urls if url.startswith(("http://", "https://"))]
+    context = "\n\n".join(f"{hit.text}!!!SOURCE: {hit.url}!!!" for hit in hits)
+    logger.info(f"Local index hit: confidence {confidence:.2f}, {len(hits)} passages")
+    return links, context
+
+
+@singleflight(lambda query: query)
 async def search_serpstack(query: str) -> List[str]:
     """
     Выполняет поиск через Serpstack API и возвращает список URL-адресов органических результатов.
+    Вызовы идут через search_limiter: 429 и 5xx повторяются, а при переполненной
+    очереди или разомкнутой цепи поднимается UpstreamUnavailable.
+    Непустая выдача кэшируется для всех воркеров на SEARCH_CACHE_TTL.
     """
 
     clean_query = f"{query} ITMO".strip()
+    cache_key = f"{SEARCH_RESULTS}:" + " ".join(clean_query.casefold().split())
+    if shared_cache is not None:
+        cached = await shared_cache.get("search", cache_key)
+        if cached is not None:
+            return cached
 
     params = {
         "access_key": SEARCH_API_KEY,
         "query": clean_query,
-        "num": 5,
+        "num": SEARCH_RESULTS,
         "gl": "ru",
         "hl": "ru",
         "device": "desktop",
         "auto_location": 0
     }
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    SEARCH_URL,
-                    params=params,
-                    timeout=aiohttp.ClientTimeout(total=5)
-            ) as resp:
+    async def _request() -> Optional[dict]:
+        session = await get_http_session()
+        async with session.get(
+                SEARCH_URL,
+                params=params,
+                timeout=aiohttp.ClientTimeout(total=stage_timeout(SERPSTACK_TIMEOUT))
+        ) as resp:
+
+            # logger.info(f"Request URL: {resp.url}")
+
+            if resp.status == 429 or resp.status >= 500:
+                raise UpstreamHTTPError(resp.status)
+            if resp.status != 200:
+                logger.error(f"HTTP Error {resp.status}")
+                return None
+            return await resp.json()
+
+    with timed("serpstack"):
+        try:
+            data = await search_limiter.call(_request)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.exception(f"Critical error: {str(e)}")
+            return []
+
+    # logger.debug(f"Raw API response: {data}")
+
+    # Проверка структуры ответа
+    if not isinstance(data, dict) or not isinstance(data.get("organic_results"), list):
+        logger.error("Invalid organic_results format")
+        return []
 
-                # logger.info(f"Request URL: {resp.url}")
+    valid_urls = []
+    for result in data.get("organic_results", []):
+        if not isinstance(result, dict):
+            continue
 
-                if resp.status != 200:
-                    logger.error(f"HTTP Error {resp.status}")
-                    return []
+        url = result.get("url")
+        if url and isinstance(url, str):
+            valid_urls.append(url)
+            if len(valid_urls) >= SEARCH_RESULTS:
+                break
 
-                data = await resp.json()
-                # logger.debug(f"Raw API response: {data}")
+    # logger.info(f"Found {len(valid_urls)} valid URLs: {valid_urls}")
+    if valid_urls and shared_cache is not None:
+        await shared_cache.set("search", cache_key, valid_urls, SEARCH_CACHE_TTL)
+    return valid_urls
 
-                # Проверка структуры ответа
-                if not isinstance(data.get("organic_results"), list):
-                    logger.error("Invalid organic_results format")
-                    return []
 
-                valid_urls = []
-                for result in data.get("organic_results", []):
-                    if not isinstance(result, dict):
-                        continue
+def merge_links(*lists: List[str], limit: int = SEARCH_RESULTS) -> List[str]:
+    """Объединяет списки ссылок без повторов, сохраняя порядок поступления."""
+    merged = list(dict.fromkeys(url for links in lists for url in links))
+    return merged[:limit]
 
-                    url = result.get("url")
-                    if url and isinstance(url, str):
-                        valid_urls.append(url)
-                        if len(valid_urls) >= 3:
-                            break
 
-                # logger.info(f"Found {len(valid_urls)} valid URLs: {valid_urls}")
-                return valid_urls
+async def _rewrite_and_search(query: str) -> List[str]:
+    refined_query = await transform_query_for_google(query)
+    return await search_serpstack(refined_query)
 
+
+async def search_links(query: str, mode: str = SEARCH_MODE) -> List[str]:
+    """
+    Ссылки для вопроса пользователя.
+      sequential  — переформулировка LLM, затем поиск (как раньше);
+      speculative — одновременно поиск по вопросу без вариантов ответа и
+                    переформулировка + поиск; берётся первый результат,
+                    в котором не меньше SPECULATIVE_MIN_URLS ссылок, второй
+                    отменяется, иначе результаты объединяются;
+      fanout      — оба поиска всегда доводятся до конца и объединяются.
+    """
+    if mode == "sequential":
+        return await _rewrite_and_search(query)
+
+    question, _ = split_options(query)
+    tasks = [
+        asyncio.create_task(search_serpstack(question or query)),
+        asyncio.create_task(_rewrite_and_search(query)),
+    ]
+    merged: List[str] = []
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.index):
+                try:
+                    merged = merge_links(merged, task.result())
+                except Exception as e:
+                    logger.error(f"Search task failed: {type(e).__name__}")
+                    continue
+                if mode == "speculative" and len(task.result()) >= SPECULATIVE_MIN_URLS:
+                    return merged
+        return merged
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _page_decoder(charset: Optional[str], head: bytes) -> codecs.IncrementalDecoder:
+    if charset:
+        try:
+            return codecs.getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            pass
+    return codecs.getincrementaldecoder(detect_charset(head))(errors="replace")
+
+
+async def read_page_body(resp: aiohttp.ClientResponse) -> str:
+    """
+    Читает тело ответа кусками с инкрементальным декодированием. Кодировка —
+    из заголовка, а если его нет, определяется по первому куску (см.
+    detect_charset). Прекращает
+    чтение, если превышен PAGE_MAX_BYTES или видимого текста уже набралось
+    PAGE_TEXT_TARGET_CHARS. Ответы с типом не из PAGE_CONTENT_TYPES (PDF,
+    картинки и т.п.) не читаются вовсе — возвращается пустая строка.
+    """
+    if resp.content_type not in PAGE_CONTENT_TYPES:
+        return ""
+
+    decoder = None
+    estimator = TextEstimator()
+    parts: List[str] = []
+    received = 0
+    async for chunk in resp.content.iter_chunked(PAGE_CHUNK_SIZE):
+        chunk = chunk[:PAGE_MAX_BYTES - received]
+        received += len(chunk)
+        if decoder is None:
+            decoder = _page_decoder(resp.charset, chunk)
+        part = decoder.decode(chunk)
+        parts.append(part)
+        if received >= PAGE_MAX_BYTES or estimator.feed(part) >= PAGE_TEXT_TARGET_CHARS:
+            break
+    else:
+        if decoder is not None:
+            parts.append(decoder.decode(b"", final=True))
+    FETCH_BYTES.inc(received)
+    return "".join(parts)
+
+
+async def download_page(session: aiohttp.ClientSession, link: str, cached: Optional[dict] = None) -> str:
+    """
+    Скачивает страницу и сохраняет извлечённый текст в хранилище. Если есть
+    сохранённая копия, запрос условный: на 304 копия считается обновлённой.
+    При ошибке возвращает пустую строку. Длительность и исход попадают в host_stats.
+    """
+    started = time.monotonic()
+    text = await _download_page(session, link, cached)
+    host_stats.record(host_of(link), time.monotonic() - started, bool(text))
+    return text
+
+
+async def _download_page(session: aiohttp.ClientSession, link: str, cached: Optional[dict] = None) -> str:
+    headers = {}
+    if cached is not None:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        async with session.get(
+                link,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=PAGE_REFRESH_TIMEOUT)
+        ) as resp:
+            if resp.status == 304 and cached is not None:
+                PAGES_FETCHED.labels("not_modified").inc()
+                if page_store is not None:
+                    await page_store.touch_page(link)
+                return cached["text"]
+            if resp.status != 200:
+                PAGES_FETCHED.labels("http_error").inc()
+                return ""
+            if PAGE_STREAMING:
+                content = await read_page_body(resp)
+            else:
+                body = await resp.read()
+                FETCH_BYTES.inc(len(body))
+                content = body.decode(resp.get_encoding(), errors="replace")
+            if not content:
+                PAGES_FETCHED.labels("empty").inc()
+                return ""
+            text = await extract_text(content)
+            PAGES_FETCHED.labels("ok").inc()
+            if page_store is not None and text:
+                await page_store.put_page(
+                    link, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+                )
+            # logger.info(f"Страница {link} загружена, размер: {len(text)} символов")
+            return text
     except Exception as e:
-        logger.exception(f"Critical error: {str(e)}")
-        return []
+        # logger.error(f"Ошибка при загрузке {link}: {type(e).__name__}")
+        PAGES_FETCHED.labels("error").inc()
+        return ""
+
+
+def _download_task(session: aiohttp.ClientSession, link: str, cached: Optional[dict] = None) -> asyncio.Task:
+    # Загрузка идёт отдельной задачей и не отменяется вместе с запросом:
+    # медленная страница всё равно попадёт в хранилище к следующему вопросу
+    task = _downloads.get(link)
+    if task is None:
+        task = asyncio.create_task(download_page(session, link, cached))
+        _downloads[link] = task
+        INFLIGHT_FETCHES.inc()
+
+        def _done(_: asyncio.Task) -> None:
+            _downloads.pop(link, None)
+            INFLIGHT_FETCHES.dec()
+
+        task.add_done_callback(_done)
+    return task
 
 
+@singleflight(lambda session, link: link)
 async def fetch_page_content(session: aiohttp.ClientSession, link: str) -> str:
+    """
+    Текст страницы с маркером источника. Сохранённая копия отдаётся сразу;
+    если она устарела, в фоне запускается условный запрос (stale-while-revalidate).
+    """
     try:
         # logger.info(f"Начинаю загрузку страницы: {link}")
-        async with session.get(link) as resp:
-
-            content = await asyncio.wait_for(resp.text(), timeout=1.0)
-            text = BeautifulSoup(content, "html.parser").get_text()
-            # logger.info(f"Страница {link} загружена, размер: {len(text)} символов")
-            return text + f"!!!SOURCE: {link}!!!"
+        cached = await page_store.get_page(link) if page_store is not None else None
+        if cached is not None:
+            if time.time() - cached["fetched_at"] > PAGE_STORE_FRESH_TTL:
+                CACHE_LOOKUPS.labels("page", "stale_hit").inc()
+                _download_task(session, link, cached)
+            else:
+                CACHE_LOOKUPS.labels("page", "hit").inc()
+            text = cached["text"]
+        else:
+            if page_store is not None:
+                CACHE_LOOKUPS.labels("page", "miss").inc()
+            with timed("fetch"):
+                text = await asyncio.shield(_download_task(session, link))
+        if not text:
+            return ""
+        return text + f"!!!SOURCE: {link}!!!"
     except Exception as e:
         # logger.error(f"Ошибка при загрузке {link}: {type(e).__name__}")
         return ""
 
 
-async def fetch_page_texts(links: List[str]) -> List[str]:
+def order_links(links: List[str], budget: float) -> List[Tuple[int, str]]:
+    """
+    Порядок загрузки ссылок: как в выдаче, но хосты, которые обычно отказывают
+    или не укладываются в budget секунд, идут в конце.
+    """
+    return sorted(enumerate(links), key=lambda item: (host_stats.unreliable(host_of(item[1]), budget), item[0]))
+
+
+async def iter_page_texts(
+    links: List[str], pages: int = FETCH_PAGES, parallel: int = FETCH_PARALLEL
+) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Загружает страницы и отдаёт пары (индекс ссылки, текст) по мере готовности,
+    пока не наберётся pages удачных страниц; остальные загрузки отменяются.
+
+    Сразу качаются первые parallel ссылок (см. order_links). Если загрузка
+    идёт дольше обычного для своего хоста (host_stats.hedge_delay) или
+    завершилась неудачей, запускается следующая ссылка — кто первым отдаст
+    страницу, тот и попадёт в контекст. Все загрузки укладываются в общий
+    бюджет этапа PAGE_FETCH_TIMEOUT, но хосту не дают больше его обычного p99.
+    """
     # logger.info(f"Начинаю загрузку списка ссылок: {links}")
-    async with aiohttp.ClientSession() as session:
-
-        tasks = [
-            asyncio.create_task(
-                asyncio.wait_for(fetch_page_content(session, link), timeout=1.0)
-            )
-            for link in links[:5]
-        ]
-
-        results = []
-        for future in asyncio.as_completed(tasks):
-            try:
-                result = await future
-                if result:
-                    results.append(result)
-                    if len(results) >= 3:
-                        break
-            except Exception as e:
-                logger.error(f"Ошибка в задаче: {type(e).__name__}")
+    session = await get_http_session()
+
+    timeout = stage_timeout(PAGE_FETCH_TIMEOUT, ANSWER_RESERVE)
+    if not timeout:
+        skip("fetch")
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    candidates = order_links(links, timeout)
+    # Задача загрузки -> (индекс ссылки, момент, после которого она считается медленной)
+    tasks: Dict[asyncio.Task, Tuple[int, float]] = {}
+    pending: Set[asyncio.Task] = set()
+    hedged: Set[asyncio.Task] = set()
+
+    def start_next(reason: str = "") -> None:
+        left = deadline - loop.time()
+        if not candidates or left <= 0:
+            return
+        idx, link = candidates.pop(0)
+        host = host_of(link)
+        limit = host_stats.percentile(host, 0.99)
+        task = asyncio.create_task(
+            asyncio.wait_for(fetch_page_content(session, link), timeout=min(left, limit * 2) if limit else left)
+        )
+        tasks[task] = (idx, loop.time() + host_stats.hedge_delay(host))
+        pending.add(task)
+        if reason:
+            FETCH_HEDGES.labels(reason).inc()
 
-        for task in tasks:
-            if not task.done():
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
+    for _ in range(max(parallel, 1)):
+        start_next()
 
-        logger.info(f"Успешно загружено {len(results)} страниц")
-        return results[:3]
+    loaded = 0
+    try:
+        while pending and loaded < pages:
+            slow_at = [tasks[task][1] for task in pending if task not in hedged]
+            wait = max(min(slow_at) - loop.time(), 0.0) if slow_at and candidates else None
+            done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            now = loop.time()
+            for task in list(pending):
+                if task not in hedged and tasks[task][1] <= now:
+                    hedged.add(task)
+                    start_next("slow")
+            for task in sorted(done, key=lambda t: tasks[t][0]):
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.error(f"Ошибка в задаче: {type(e).__name__}")
+                    result = ""
+                if result and loaded < pages:
+                    loaded += 1
+                    yield tasks[task][0], result
+                elif not result and loaded < pages:
+                    start_next("failed")
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    logger.info(f"Успешно загружено {loaded} страниц из {len(tasks)} начатых загрузок")
+
+
+async def fetch_page_texts(links: List[str]) -> List[Tuple[int, str]]:
+    """
+    Возвращает до FETCH_PAGES пар (индекс ссылки, текст) в порядке ссылок
+    (а не завершения загрузки) — только страницы, которые удалось загрузить.
+    """
+    return sorted([item async for item in iter_page_texts(links)])
 
 
 def truncate_text(text: str, start: int = 500, end: int = 1000) -> str:
@@ -157,16 +492,7 @@ def truncate_text(text: str, start: int = 500, end: int = 1000) -> str:
     return text[start:min(end, len(text))]
 
 
-async def compress_pages_for_itmo(raw_texts: List[str]) -> str:
-    """
-    Для каждого текста:
-      1. Убираем HTML-теги
-      2. Удаляем любые пробелы/переносы строк
-      3. Оставляем первые 10000 символов
-      4. Вызываем LLM (run_model) с просьбой выделить сведения про ИТМО
-    """
-    logger.info(f"Запускаю compress_pages_for_itmo для {len(raw_texts)} страниц")
-
+def compress_messages(text: str) -> List[dict]:
     system_msg = {
         "role": "system",
         "text": (
@@ -185,23 +511,120 @@ async def compress_pages_for_itmo(raw_texts: List[str]) -> str:
         )
     }
 
-    summaries = []
-    for idx, txt in enumerate(raw_texts):
-        text_no_html = BeautifulSoup(txt, "html.parser").get_text()
-        text_one_space = re.sub(r"\s+", " ", text_no_html).strip()
+    user_msg = {"role": "user", "text": text}
+    return [system_msg, assistant_msg, user_msg]
+
+
+def page_fragment(text: str, query: str = "") -> str:
+    """
+    Фрагмент страницы для суммаризации: предложения, релевантные вопросу и
+    ключевым словам ИТМО (PASSAGE_SELECTION), иначе — символы с 500 по 2000.
+    """
+    if PASSAGE_SELECTION:
+        selected = select_passages(text, query)
+        if selected:
+            return selected
+    return truncate_text(text, 500, 2000)
+
 
-        text_truncated = truncate_text(text_one_space, 500, 2000)
+async def summarize_page(idx: int, txt: str, semaphore: asyncio.Semaphore, query: str = "") -> str:
+    # Текст уже извлечён из HTML при загрузке (extract_text), повторно не разбираем
+    text_one_space = re.sub(r"\s+", " ", txt).strip()
 
-        user_msg = {"role": "user", "text": text_truncated}
-        messages = [system_msg, assistant_msg, user_msg]
+    text_truncated = page_fragment(text_one_space, query)
 
-        summary = await run_model(messages)
+    # Выжимка зависит только от отправленного в модель фрагмента
+    key = content_hash(text_truncated)
+    if page_store is not None:
+        cached = await page_store.get_summary(key)
+        CACHE_LOOKUPS.labels("summary", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return cached
 
-        logger.info(f"Page #{idx} summary (first 50 chars): {summary[:50]}...")
-        summaries.append(summary.strip())
+    # Если до дедлайна не успеть суммаризовать, в контекст идёт сам фрагмент
+    timeout = stage_timeout(COMPRESS_TIMEOUT, ANSWER_RESERVE)
+    if timeout is not None and timeout < COMPRESS_MIN_TIME:
+        skip("compress")
+        return text_truncated
+
+    async def _summarize() -> str:
+        async with semaphore:
+            return await run_model(compress_messages(text_truncated))
+
+    try:
+        with timed("compress"):
+            summary = await asyncio.wait_for(_summarize(), timeout=timeout)
+    except (asyncio.TimeoutError, UpstreamUnavailable):
+        skip("compress")
+        return text_truncated
+
+    logger.info(f"Page #{idx} summary (first 50 chars): {summary[:50]}...")
+    summary = summary.strip()
+    if page_store is not None:
+        await page_store.put_summary(key, summary)
+    return summary
+
+
+async def summarize_and_emit(
+    idx: int, txt: str, semaphore: asyncio.Semaphore, query: str = "", url: str = ""
+) -> str:
+    """summarize_page + событие "summary" для потокового ответа."""
+    summary = await summarize_page(idx, txt, semaphore, query)
+    emit("summary", {"index": idx, "url": url, "summary": summary})
+    return summary
+
+
+async def compress_pages_for_itmo(
+    raw_texts: List[str], query: str = "", concurrency: int = COMPRESS_CONCURRENCY, urls: Optional[List[str]] = None
+) -> str:
+    """
+    Для каждого текста (уже без HTML, см. extract_text):
+      1. Схлопываем пробелы/переносы строк
+      2. Оставляем фрагмент, релевантный вопросу query (см. page_fragment)
+      3. Вызываем LLM (run_model) с просьбой выделить сведения про ИТМО
+    Страницы суммаризуются параллельно (не больше concurrency одновременно),
+    порядок выжимок совпадает с порядком raw_texts. urls — адреса страниц
+    для событий "summary".
+    """
+    logger.info(f"Запускаю compress_pages_for_itmo для {len(raw_texts)} страниц")
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    summaries = await asyncio.gather(
+        *(
+            summarize_and_emit(idx, txt, semaphore, query, urls[idx] if urls else "")
+            for idx, txt in enumerate(raw_texts)
+        )
+    )
+    return "\n\n".join(summaries)
+
+
+async def fetch_and_compress_pages(
+    links: List[str], query: str = "", concurrency: int = COMPRESS_CONCURRENCY
+) -> Tuple[List[int], str]:
+    """
+    Конвейерный вариант fetch_page_texts + compress_pages_for_itmo: суммаризация
+    страницы стартует сразу, как только она загружена. Возвращает индексы
+    ссылок, чьи страницы вошли в контекст, и сам контекст — в порядке ссылок,
+    как и в непоследовательном варианте.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    pages: List[Tuple[int, str]] = []
+    tasks: List[asyncio.Task] = []
+    try:
+        async for link_idx, text in iter_page_texts(links):
+            pages.append((link_idx, text))
+            tasks.append(asyncio.create_task(summarize_and_emit(link_idx, text, semaphore, query, links[link_idx])))
+        summaries = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
-    big_context = "\n\n".join(summaries)
-    return big_context
+    ordered = sorted(zip(pages, summaries), key=lambda item: item[0][0])
+    used = [link_idx for (link_idx, _), _ in ordered]
+    big_context = "\n\n".join(summary for _, summary in ordered)
+    return used, big_context
 
 
 async def ask_which_variant(user_query: str, big_context: str) -> Optional[int]:
@@ -246,6 +669,7 @@ async def ask_which_variant(user_query: str, big_context: str) -> Optional[int]:
 async def ask_explanation(user_query: str, big_context: str) -> str:
     """
     Спросить у модели пояснение. Если вариант выбран, можно подмешать его.
+    В потоковом запросе текст отдаётся клиенту событиями "token" по мере генерации.
     """
     sys_msg = {
         "role": "system",
@@ -259,5 +683,72 @@ async def ask_explanation(user_query: str, big_context: str) -> str:
         "text": f"{user_query}\n\nКонтекст:\n{big_context}"
     }
     messages = [sys_msg, user_msg]
+    if streaming():
+        parts = []
+        async for chunk in run_model_stream(messages):
+            parts.append(chunk)
+            emit("token", {"text": chunk})
+        return "".join(parts).strip()
     explanation = await run_model(messages)
     return explanation.strip()
+
+
+async def ask_answer(user_query: str, big_context: str) -> Tuple[Optional[int], str]:
+    """
+    Один вызов вместо ask_explanation + ask_which_variant: модель возвращает
+    JSON с номером варианта и кратким пояснением (см. parse_structured_answer).
+    """
+    _, options = split_options(user_query)
+    sys_msg = {
+        "role": "system",
+        "text": (
+            "Ты - эксперт по анализу информации об Университете ИТМО. Ответь на вопрос, опираясь на контекст, "
+            "а если его недостаточно - на свои знания. "
+            "Ответь строго одним JSON-объектом без пояснений вне него:\n"
+            '{"answer": <номер правильного варианта 1..N или null, если вариантов нет>, '
+            '"reasoning": "<два предложения: сам ответ и источник информации>"}\n\n'
+            "Пример:\n"
+            "Вопрос: Какая планета является самой большой в Солнечной системе?\n1. Земля\n2. Марс\n3. Юпитер\n4. Сатурн\n"
+            '{"answer": 3, "reasoning": "Самая большая планета Солнечной системы - Юпитер. Источник: справочные данные по астрономии."}'
+        )
+    }
+    user_msg = {
+        "role": "user",
+        "text": f"{user_query}\n\nКонтекст:\n{big_context}"
+    }
+    raw = await run_model([sys_msg, user_msg])
+    variant, reasoning = parse_structured_answer(raw, len(options))
+    if not options:
+        variant = None
+    return variant, reasoning
+
+
+async def ask_closed_book(user_query: str) -> Tuple[Optional[int], str, float]:
+    """
+    Ответ "по памяти" без поиска и контекста: один вызов, в котором модель
+    возвращает номер варианта, пояснение и собственную уверенность 0..1.
+    Возвращает (вариант, пояснение, уверенность); см. KNOWLEDGE_MODE.
+    """
+    _, options = split_options(user_query)
+    sys_msg = {
+        "role": "system",
+        "text": (
+            "Ты - эксперт по Университету ИТМО. Ответь на вопрос по своим знаниям, без поиска. "
+            "Оцени, насколько ты уверен в ответе: 1 - точно знаешь, 0.5 - догадка, 0 - не знаешь. "
+            "Не завышай уверенность: если факт мог измениться (даты, рейтинги, люди на должностях) "
+            "или ты его не помнишь, ставь не больше 0.5. "
+            "Ответь строго одним JSON-объектом без пояснений вне него:\n"
+            '{"answer": <номер правильного варианта 1..N или null, если вариантов нет>, '
+            '"confidence": <число от 0 до 1>, '
+            '"reasoning": "<два предложения: сам ответ и источник информации>"}\n\n'
+            "Пример:\n"
+            "Вопрос: Какая планета является самой большой в Солнечной системе?\n1. Земля\n2. Марс\n3. Юпитер\n4. Сатурн\n"
+            '{"answer": 3, "confidence": 0.98, "reasoning": "Самая большая планета Солнечной системы - Юпитер. Источник: справочные данные по астрономии."}'
+        )
+    }
+    user_msg = {"role": "user", "text": user_query}
+    raw = await run_model([sys_msg, user_msg])
+    variant, reasoning = parse_structured_answer(raw, len(options))
+    if not options:
+        variant = None
+    return variant, reasoning, parse_confidence(raw)
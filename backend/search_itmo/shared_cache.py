@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from .cache import open_sqlite
+from .config import SHARED_CACHE_PATH, SHARED_CACHE_MAX_BYTES
+from .metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def pack(value: Any) -> bytes:
+    """JSON без пробелов, сжатый zlib: выдачи и ответы модели сжимаются в 3-5 раз."""
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class SharedCache:
+    """
+    Кэш промежуточных результатов, общий для всех воркеров gunicorn: один
+    SQLite-файл (WAL), записи разложены по пространствам имён ("search" —
+    выдача Serpstack по поисковому запросу, "llm" — ответ модели по хэшу
+    промпта). У каждой записи свой срок годности; при превышении max_bytes
+    сначала удаляются просроченные записи, затем те, что истекают раньше.
+    Чтение не пишет в базу, чтобы воркеры не конкурировали за блокировку.
+
+    Все обращения к базе выполняются в пуле потоков. Ошибки SQLite не
+    пробрасываются: промах или несохранённая запись лишь стоят лишнего вызова.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT, key TEXT, value BLOB, expires_at REAL, size INTEGER, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return unpack(row[0]) if row else None
+
+    def _set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        data = pack(value)
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, size) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, data, time.time() + ttl, len(data)),
+            )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            expired = conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            removed = 0
+            if total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                rows = conn.execute("SELECT namespace, key, size FROM entries ORDER BY expires_at").fetchall()
+                for namespace, key, size in rows:
+                    if total <= target:
+                        break
+                    conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                    total -= size
+                    removed += 1
+        if expired or removed:
+            logger.info(f"Shared cache eviction: {expired} expired, {removed} evicted")
+
+    def _clear(self, namespace: Optional[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            if namespace is None:
+                return conn.execute("DELETE FROM entries").rowcount
+            return conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,)).rowcount
+
+    def _count(self, namespace: str, result: str) -> None:
+        stats = self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "sets": 0})
+        stats[result] += 1
+
+    def _open(self) -> None:
+        with self._lock:
+            self._connect()
+
+    async def connect(self) -> None:
+        """Открывает файл и создаёт таблицы заранее (прогрев воркера)."""
+        await asyncio.to_thread(self._open)
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            value = await asyncio.to_thread(self._get, namespace, key)
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.error(f"Shared cache read error: {e}")
+            value = None
+        self._count(namespace, "hits" if value is not None else "misses")
+        CACHE_LOOKUPS.labels(namespace, "hit" if value is not None else "miss").inc()
+        return value
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        try:
+            await asyncio.to_thread(self._set, namespace, key, value, ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache write error: {e}")
+            return
+        self._count(namespace, "sets")
+
+    async def clear(self, namespace: Optional[str] = None) -> int:
+        """Удаляет записи одного пространства имён (или все). Возвращает их число."""
+        return await asyncio.to_thread(self._clear, namespace)
+
+    def snapshot(self) -> dict:
+        return {
+            namespace: {**stats, "hit_rate": stats["hits"] / max(stats["hits"] + stats["misses"], 1)}
+            for namespace, stats in self.stats.items()
+        }
+
+
+shared_cache: Optional[SharedCache] = (
+    SharedCache(SHARED_CACHE_PATH, SHARED_CACHE_MAX_BYTES) if SHARED_CACHE_PATH else None
+)
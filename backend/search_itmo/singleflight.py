@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .config import SINGLEFLIGHT_ENABLED
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом: первый вызов запускает
+    работу, остальные ждут тот же результат (или то же исключение).
+    Если все ожидающие ушли (отмена, таймаут), общая задача отменяется.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(functools.partial(self._forget, key, call))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call, _task: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+def messages_key(messages: Any) -> str:
+    """Ключ для одинаковых промптов: хэш канонического JSON сообщений."""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def singleflight(key_fn: Callable[..., Hashable]):
+    """
+    Декоратор для корутин: одновременные вызовы с одинаковым key_fn(*args, **kwargs)
+    выполняются один раз. Группа доступна как атрибут .flight обёртки.
+    """
+
+    def decorator(fn):
+        group = SingleFlight(fn.__name__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await group.do(key_fn(*args, **kwargs), lambda: fn(*args, **kwargs))
+
+        wrapper.flight = group
+        return wrapper
+
+    return decorator
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .cache import answer_cache
+from .config import LOCAL_INDEX_ENABLED, WARMUP_ENABLED, WARMUP_TIMEOUT, WARMUP_URLS
+from .extract import warm_extract_pool
+from .http_client import get_http_session
+from .local_index import get_local_index
+from .model import warm_up_backend
+from .page_store import page_store
+from .shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Готов ли воркер принимать запросы (/readyz) и итоги шагов прогрева
+_ready = False
+_report: Dict[str, dict] = {}
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def set_ready(ready: bool) -> None:
+    global _ready
+    _ready = ready
+
+
+def warmup_report() -> Dict[str, dict]:
+    return dict(_report)
+
+
+async def _open_connections() -> None:
+    # Соединение (TCP, TLS) остаётся в пуле keep-alive общего клиента,
+    # и первый настоящий запрос к сервису не платит за его установку
+    session = await get_http_session()
+    origins = list(dict.fromkeys(f"{urlsplit(url).scheme}://{urlsplit(url).netloc}/" for url in WARMUP_URLS))
+
+    async def _head(origin: str) -> None:
+        async with session.head(origin, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=WARMUP_TIMEOUT)):
+            pass
+
+    await asyncio.gather(*(_head(origin) for origin in origins))
+
+
+async def _open_caches() -> None:
+    if answer_cache is not None and answer_cache.shared is not None:
+        await answer_cache.shared.generation()
+    if page_store is not None:
+        await page_store.connect()
+    if shared_cache is not None:
+        await shared_cache.connect()
+
+
+async def _load_local_index() -> None:
+    if LOCAL_INDEX_ENABLED:
+        await asyncio.to_thread(get_local_index)
+
+
+async def _step(name: str, fn: Callable[[], Awaitable[None]]) -> Tuple[str, dict]:
+    started = time.perf_counter()
+    try:
+        await fn()
+        result = {"ok": True}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return name, result
+
+
+async def warm_up() -> None:
+    """
+    Прогрев воркера, вызывается из startup_event до приёма запросов: создаёт
+    клиент модели (импорт SDK занимает сотни миллисекунд), открывает SQLite-файлы
+    кэшей, загружает локальный индекс, запускает процессы пула разбора HTML и
+    устанавливает соединения с внешними сервисами. Шаги идут параллельно,
+    весь прогрев ограничен WARMUP_TIMEOUT. Неудачный шаг не мешает работе —
+    он лишь будет выполнен лениво при первом запросе; после прогрева
+    воркер считается готовым.
+    """
+    global _report
+    if WARMUP_ENABLED:
+        steps: List[Tuple[str, Callable[[], Awaitable[None]]]] = [
+            ("llm_backend", warm_up_backend),
+            ("caches", _open_caches),
+            ("local_index", _load_local_index),
+            ("extract_pool", warm_extract_pool),
+            ("connections", _open_connections),
+        ]
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(_step(name, fn)) for name, fn in steps]
+        done, pending = await asyncio.wait(tasks, timeout=WARMUP_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        _report = dict(task.result() for task in done)
+        for (name, _), task in zip(steps, tasks):
+            if task in pending:
+                _report[name] = {"ok": False, "error": "timeout"}
+        failed = [name for name, result in _report.items() if not result["ok"]]
+        logger.info(
+            f"Warm-up finished in {time.perf_counter() - started:.2f}s"
+            + (f", failed: {', '.join(failed)}" if failed else "")
+        )
+    set_ready(True)
@@ -1,7 +1,13 @@
 #!/bin/bash
 
+# Каталог для метрик prometheus_client в режиме нескольких процессов:
+# очищается при каждом запуске, чтобы не суммировать счётчики прошлых запусков
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/itmo_metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 gunicorn main:app \
+  --config gunicorn.conf.py \
   --workers 8 \
   --worker-class uvicorn.workers.UvicornWorker \
   --bind 0.0.0.0:8080 \
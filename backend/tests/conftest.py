@@ -0,0 +1,23 @@
+"""
+Модульные тесты: python -m pytest tests (из каталога backend). Внешние
+сервисы не нужны — модель заглушка, кэши и хранилища во временном каталоге.
+tests/test.py — отдельный скрипт проверки развёрнутого API, pytest его не собирает.
+"""
+import os
+import sys
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="search_itmo_tests_")
+for name, value in {
+    "LLM_BACKEND": "stub",
+    "LOCAL_INDEX_ENABLED": "0",
+    "WARMUP_URLS": "",
+    "ACCESS_LOG_PATH": "",
+    "ACCESS_LOG_STDOUT": "0",
+    "ANSWER_CACHE_SQLITE": os.path.join(_workdir, "answers.sqlite3"),
+    "PAGE_STORE_PATH": os.path.join(_workdir, "pages.sqlite3"),
+    "SHARED_CACHE_PATH": os.path.join(_workdir, "shared.sqlite3"),
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
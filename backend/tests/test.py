@@ -139,9 +139,41 @@ def run_test(test_case: Dict, api_url: str) -> bool:
         print(f"Test {test_case['id']} ❌: Error - {str(e)}")
     return False
 
+def run_batch(test_cases: List[Dict], api_url: str) -> int:
+    """
+    Отправляет все кейсы одним запросом в /api/batch.
+    Возвращает число правильных ответов.
+    """
+    try:
+        response = requests.post(
+            f"{api_url}/api/batch",
+            json=[{"id": test_case["id"], "query": test_case["query"]} for test_case in test_cases],
+            timeout=600
+        )
+    except requests.RequestException as e:
+        print(f"Batch ❌: Error - {str(e)}")
+        return 0
+
+    if response.status_code != 200:
+        print(f"Batch ❌: HTTP Error {response.status_code}")
+        return 0
+
+    success_count = 0
+    for test_case, item in zip(test_cases, response.json()):
+        received_answer = item.get("answer")
+        if "error" in item:
+            print(f"Test {test_case['id']} ❌: Error - {item['error']}")
+        elif received_answer == test_case["expected_answer"]:
+            print(f"Test {test_case['id']} ✅: Correct answer {received_answer}")
+            success_count += 1
+        else:
+            print(f"Test {test_case['id']} ❌: Expected {test_case['expected_answer']}, got {received_answer}")
+    return success_count
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="API Tester for ITMO Q&A System")
     parser.add_argument("--api-url", required=True, help="Base URL of the API (e.g. http://localhost:8080)")
+    parser.add_argument("--batch", action="store_true", help="Send all questions in one /api/batch request")
     args = parser.parse_args()
     api_url = args.api_url.rstrip('/')
 
@@ -155,12 +187,15 @@ if __name__ == "__main__":
 
     max_workers = 10
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_test = {executor.submit(run_test, test_case, api_url): test_case for test_case in test_queue}
+    if args.batch:
+        success_count = run_batch(test_queue, api_url)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_test = {executor.submit(run_test, test_case, api_url): test_case for test_case in test_queue}
 
-        for future in concurrent.futures.as_completed(future_to_test):
-            if future.result():
-                success_count += 1
+            for future in concurrent.futures.as_completed(future_to_test):
+                if future.result():
+                    success_count += 1
 
     elapsed_time = time.perf_counter() - start_time
     print(f"\nResults: {success_count}/{total_requests} passed ({success_count / total_requests:.0%})")
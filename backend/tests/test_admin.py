@@ -0,0 +1,17 @@
+import main
+from fastapi.testclient import TestClient
+
+client = TestClient(main.app)
+
+
+def test_admin_closed_without_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.get("/api/admin/limiters").status_code == 403
+    assert client.delete("/api/admin/cache").status_code == 403
+    assert client.get("/api/admin/cache", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_admin_requires_matching_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/admin/limiters", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/admin/limiters", headers={"X-Admin-Token": "secret"}).status_code == 200
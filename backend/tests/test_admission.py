@@ -0,0 +1,73 @@
+import asyncio
+
+from search_itmo import pipeline
+from search_itmo.admission import AdmissionController, Overloaded, Ticket
+from search_itmo.deadline import start_request
+
+
+def test_promoted_ticket_is_admitted_first():
+    async def run():
+        admission = AdmissionController(max_active=1, max_queue=8, max_wait=30)
+        order = []
+
+        async def job(name: str, ticket: Ticket):
+            async with admission.slot(ticket=ticket):
+                order.append(name)
+
+        await admission.acquire(Ticket("interactive"))
+        batch = Ticket("batch")
+        tasks = [asyncio.create_task(job("batch", batch)), asyncio.create_task(job("normal", Ticket("normal")))]
+        await asyncio.sleep(0)
+        admission.promote(batch, "interactive")
+        admission.release(None)
+        await asyncio.gather(*tasks)
+        return order, admission.snapshot()
+
+    order, snapshot = asyncio.run(run())
+    assert order == ["batch", "normal"]
+    assert snapshot["active"] == 0 and sum(snapshot["queued"].values()) == 0
+
+
+def test_promoted_ticket_is_not_preempted():
+    async def run():
+        admission = AdmissionController(max_active=1, max_queue=1, max_wait=30)
+        await admission.acquire(Ticket("interactive"))
+        batch = Ticket("batch")
+        waiting = asyncio.create_task(admission.acquire(batch))
+        await asyncio.sleep(0)
+        admission.promote(batch, "interactive")
+        try:
+            await admission.acquire(Ticket("normal"))
+        except Overloaded as e:
+            rejected = e.reason
+        admission.release(None)
+        await waiting
+        return rejected
+
+    assert asyncio.run(run()) == "queue full"
+
+
+def test_follower_raises_flight_priority(monkeypatch):
+    seen = []
+
+    async def fake_compute(query, ticket):
+        await asyncio.sleep(0.05)
+        seen.append(ticket.priority)
+        return {"answer": None, "reasoning": "", "sources": [], "skipped_stages": []}
+
+    async def no_cache(query):
+        return None
+
+    monkeypatch.setattr(pipeline, "_admitted_compute", fake_compute)
+    monkeypatch.setattr(pipeline, "cached_answer", no_cache)
+
+    async def run():
+        start_request(30)
+        leader = asyncio.create_task(pipeline.get_answer("Вопрос про ИТМО?", "batch"))
+        await asyncio.sleep(0.01)
+        await pipeline.get_answer("Вопрос про ИТМО?", "interactive")
+        await leader
+
+    asyncio.run(run())
+    assert seen == ["interactive"]
+    assert not pipeline._flight_tickets
@@ -0,0 +1,19 @@
+from search_itmo.cache import SQLiteCache
+
+
+def count_rows(cache: SQLiteCache) -> int:
+    return cache._connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+def test_expired_rows_deleted_on_write(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "answers.sqlite3"), ttl=-1)
+    cache.EVICT_EVERY = 3
+    cache._set("a", {"answer": 1})
+    cache._set("b", {"answer": 2})
+    assert count_rows(cache) == 2
+    assert cache._get("a") is None
+
+    cache.ttl = 60
+    cache._set("c", {"answer": 3})
+    assert count_rows(cache) == 1
+    assert cache._get("c") == {"answer": 3}
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from search_itmo import pipeline
+from search_itmo.deadline import start_request
+
+QUERY = "В каком году основан ИТМО?\n1. 1900\n2. 1930\n3. 1992\n4. 2000"
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_closed_book_error_falls_back_to_retrieval(monkeypatch, mode):
+    async def broken_closed_book(query):
+        raise ValueError("bad JSON from the model")
+
+    async def fake_retrieve(query):
+        return ["https://itmo.ru/"], "ИТМО основан в 1900 году."
+
+    monkeypatch.setattr(pipeline, "KNOWLEDGE_MODE", mode)
+    monkeypatch.setattr(pipeline, "ask_closed_book", broken_closed_book)
+    monkeypatch.setattr(pipeline, "retrieve_context", fake_retrieve)
+
+    async def run():
+        start_request(30)
+        return await pipeline.answer_query(QUERY)
+
+    result = asyncio.run(run())
+    assert result["sources"] == ["https://itmo.ru/"]
+    assert not result.get("closed_book")
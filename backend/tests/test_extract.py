@@ -0,0 +1,45 @@
+import asyncio
+import os
+import signal
+
+from search_itmo import extract
+
+HTML = "<html><body><p>Университет ИТМО</p>" + "<p>текст</p>" * 200 + "</body></html>"
+
+
+def test_broken_pool_is_recreated(monkeypatch):
+    monkeypatch.setattr(extract, "EXTRACT_INLINE_MAX_BYTES", 0)
+    monkeypatch.setattr(extract, "EXTRACT_WORKERS", 1)
+
+    async def run():
+        first = await extract.extract_text(HTML)
+        pool = extract._pool
+        # Процесс пула умирает, как при OOM
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        after_kill = await extract.extract_text(HTML)
+        assert extract._pool is not pool
+        again = await extract.extract_text(HTML)
+        assert extract._pool is not None and extract._pool is not pool
+        return first, after_kill, again
+
+    try:
+        first, after_kill, again = asyncio.run(run())
+    finally:
+        extract.shutdown_extract_pool()
+    assert "Университет ИТМО" in first
+    assert after_kill == first
+    assert again == first
+
+
+def test_wiki_fixture_parsers_agree():
+    path = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures", "itmo_wiki_ru.html")
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    texts = [extract.html_to_text(html, parser="bs4")]
+    if extract.HTMLParser is not None:
+        texts.append(extract.html_to_text(html, parser="selectolax"))
+    for text in texts:
+        assert "Ленинградский институт точной механики и оптики" in text
+        assert "RLCONF" not in text and "mw-parser-output" not in text
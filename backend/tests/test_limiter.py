@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from search_itmo.limiter import AdaptiveLimiter
+
+
+def make_limiter() -> AdaptiveLimiter:
+    return AdaptiveLimiter("test", initial=4, max_limit=4, max_queue=4, retries=0, breaker_failures=2, cooldown=0.05)
+
+
+def test_only_probe_closes_half_open_circuit():
+    async def run():
+        limiter = make_limiter()
+        # Вызов начат до размыкания цепи и завершится успешно уже после него
+        straggler = await limiter.acquire()
+        for _ in range(2):
+            limiter.release("transient", await limiter.acquire())
+        assert limiter.state == "open"
+        time.sleep(0.06)
+        probe = await limiter.acquire()
+        assert probe and limiter.state == "half_open"
+        limiter.release("ok", straggler)
+        assert limiter.state == "half_open"
+        limiter.release("ok", probe)
+        assert limiter.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_failed_probe_reopens_and_stragglers_do_not():
+    async def run():
+        limiter = make_limiter()
+        straggler = await limiter.acquire()
+        for _ in range(2):
+            limiter.release("transient", await limiter.acquire())
+        time.sleep(0.06)
+        probe = await limiter.acquire()
+        limiter.release("transient", straggler)
+        assert limiter.state == "half_open"
+        limiter.release("transient", probe)
+        assert limiter.state == "open"
+
+    asyncio.run(run())
+
+
+def test_stream_timeout_counts_as_transient():
+    from search_itmo import model
+
+    class SlowBackend(model.LLMBackend):
+        async def stream(self, messages):
+            yield "начало"
+            await asyncio.sleep(1)
+            yield "конец"
+
+    async def run():
+        before = model.llm_limiter.stats["transient"]
+        chunks = []
+        try:
+            async for chunk in model.run_model_stream([{"role": "user", "text": "?"}], timeout=0.1):
+                chunks.append(chunk)
+        except asyncio.TimeoutError:
+            pass
+        return chunks, model.llm_limiter.stats["transient"] - before, model.llm_limiter.inflight
+
+    model.set_backend(SlowBackend())
+    try:
+        chunks, transient, inflight = asyncio.run(run())
+    finally:
+        model.set_backend(None)
+    assert chunks == ["начало"] and transient == 1 and inflight == 0
@@ -0,0 +1,19 @@
+import asyncio
+
+from search_itmo import services
+from search_itmo.local_index import Hit
+
+
+class FakeIndex:
+    def search(self, query, top_k):
+        hits = [Hit(10.0 - i, f"https://itmo.ru/page{i // 2}", f"пассаж {i}") for i in range(16)]
+        return hits, 1.0
+
+
+def test_local_sources_capped(monkeypatch):
+    monkeypatch.setattr(services, "get_local_index", FakeIndex)
+    monkeypatch.setattr(services, "MAX_SOURCES", 3)
+    links, context = asyncio.run(services.retrieve_local("Сколько кампусов у ИТМО?"))
+    assert links == ["https://itmo.ru/page0", "https://itmo.ru/page1", "https://itmo.ru/page2"]
+    assert context.count("!!!SOURCE") == 6
+    assert "page3" not in context
@@ -0,0 +1,57 @@
+import pytest
+
+from search_itmo.options import parse_confidence, parse_structured_answer, split_options
+
+
+def test_split_options():
+    question, options = split_options("Сколько кампусов у ИТМО?\n1. 1\n2) 2\n3 - 5")
+    assert question == "Сколько кампусов у ИТМО?"
+    assert options == ["1", "2", "5"]
+
+
+def test_fenced_json():
+    raw = '```json\n{"answer": 3, "reasoning": "Так написано на itmo.ru"}\n```'
+    assert parse_structured_answer(raw, 4) == (3, "Так написано на itmo.ru")
+
+
+def test_json_prefix_only_after_fence():
+    variant, reasoning = parse_structured_answer("JSONовый формат не нужен, ответ: 2", 4)
+    assert variant == 2
+    assert reasoning.startswith("JSONовый")
+
+
+def test_truncated_json():
+    variant, reasoning = parse_structured_answer('```json\n{"answer": 2, "reasoning": "Кампус на Кронверкском', 4)
+    assert variant == 2
+    assert reasoning == "Кампус на Кронверкском"
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Правильный ответ 2, потому что так указано на сайте", 2),
+    ("Ответ — вариант 3", 3),
+    ("The answer is 1.", 1),
+    ("4\nПотому что так написано", 4),
+])
+def test_free_text(raw, expected):
+    assert parse_structured_answer(raw, 4)[0] == expected
+
+
+@pytest.mark.parametrize("answer", ["7", "0", "true", "2.5", '"много"'])
+def test_out_of_range_or_not_a_number(answer):
+    assert parse_structured_answer('{"answer": %s, "reasoning": "-"}' % answer, 4)[0] is None
+
+
+def test_integral_float_accepted():
+    assert parse_structured_answer('{"answer": 2.0, "reasoning": "-"}', 4)[0] == 2
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('"confidence": 0.85', 0.85),
+    ('"confidence": 85', 0.85),
+    ("уверенность: 72,5", 0.725),
+    ('"confidence": 1.5', 1.0),
+    ('"confidence": 250', 1.0),
+    ('"reasoning": "без уверенности"', 0.0),
+])
+def test_confidence(raw, expected):
+    assert parse_confidence(raw) == pytest.approx(expected)
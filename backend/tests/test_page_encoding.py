@@ -0,0 +1,48 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from search_itmo.http_client import detect_charset
+from search_itmo.services import read_page_body
+
+TEXT = "Университет ИТМО — национальный исследовательский университет в Санкт-Петербурге"
+
+
+def page(meta: str = "") -> str:
+    return f"<html><head>{meta}<title>ИТМО</title></head><body><p>{TEXT}</p></body></html>"
+
+
+async def fetch(body: bytes, content_type: str) -> str:
+    async def handler(request):
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        async with session.get(server.make_url("/")) as resp:
+            return await read_page_body(resp)
+
+
+@pytest.mark.parametrize(
+    "body, content_type",
+    [
+        (page().encode("utf-8"), "text/html; charset=utf-8"),
+        (page().encode("cp1251", errors="replace"), "text/html; charset=windows-1251"),
+        (page('<meta charset="windows-1251">').encode("cp1251", errors="replace"), "text/html"),
+        (page('<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">').encode("koi8-r", errors="replace"), "text/html"),
+        (page().encode("cp1251", errors="replace"), "text/html"),
+        (page().encode("utf-8"), "text/html"),
+    ],
+)
+def test_read_page_body_decodes_cyrillic(body, content_type):
+    text = asyncio.run(fetch(body, content_type))
+    assert "Университет ИТМО" in text and "Санкт-Петербурге" in text
+
+
+def test_detect_charset_without_meta():
+    assert detect_charset(page().encode("cp1251", errors="replace")) == "cp1251"
+    assert detect_charset(page().encode("koi8-r", errors="replace")) == "koi8-r"
+    assert detect_charset(page().encode("utf-8")) == "utf-8"
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+from search_itmo.page_store import PageStore
+
+
+def accessed_at(store: PageStore, url: str) -> float:
+    return store._connect().execute("SELECT accessed_at FROM pages WHERE url = ?", (url,)).fetchone()[0]
+
+
+def test_reads_touch_access_time_at_most_once_per_interval():
+    with tempfile.TemporaryDirectory() as workdir:
+        store = PageStore(os.path.join(workdir, "pages.sqlite3"), 10 ** 9, touch_interval=600)
+        store._put_page("https://itmo.ru/", "текст", None, None)
+        conn = store._connect()
+        conn.execute("UPDATE pages SET accessed_at = 100")
+        before = conn.total_changes
+
+        assert store._get_page("https://itmo.ru/")["text"] == "текст"
+        touched = accessed_at(store, "https://itmo.ru/")
+        assert touched > 100
+
+        # Повторные чтения в пределах интервала в базу не пишут
+        for _ in range(5):
+            store._get_page("https://itmo.ru/")
+        assert accessed_at(store, "https://itmo.ru/") == touched
+        assert conn.total_changes - before == 1
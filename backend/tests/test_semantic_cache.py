@@ -0,0 +1,75 @@
+import math
+
+from search_itmo import semantic_cache
+from search_itmo.semantic_cache import SemanticCache
+
+OPTIONS = "\n1. 500\n2. 1500\n3. 3000\n4. 5000"
+RESULT = {"answer": 3, "reasoning": "…", "sources": ["https://itmo.ru/"]}
+
+
+def make_cache() -> SemanticCache:
+    cache = SemanticCache(capacity=16, dim=1024)
+    cache.set("Сколько студентов в ИТМО?" + OPTIONS, RESULT)
+    return cache
+
+
+def test_paraphrase_hits():
+    cache = SemanticCache(capacity=16, dim=1024)
+    cache.set("Сколько кампусов у ИТМО?\n1. 1\n2. 2\n3. 5\n4. 7", RESULT)
+    assert cache.get("Какое количество кампусов имеет университет ИТМО?\n1. 1\n2. 2\n3. 5\n4. 7") == RESULT
+
+
+def test_reordered_options_remap_answer():
+    cache = make_cache()
+    hit = cache.get("Какое количество студентов в ИТМО?\n1. 5000\n2. 3000\n3. 1500\n4. 500")
+    assert hit is not None and hit["answer"] == 2
+
+
+def test_changed_qualifier_misses():
+    assert make_cache().get("Сколько иностранных студентов в ИТМО?" + OPTIONS) is None
+
+
+def test_changed_entity_misses():
+    assert make_cache().get("Сколько студентов в МГУ?" + OPTIONS) is None
+
+
+def test_changed_number_misses():
+    cache = SemanticCache(capacity=16, dim=1024)
+    cache.set("Сколько студентов было в ИТМО в 2020 году?" + OPTIONS, RESULT)
+    assert cache.get("Сколько студентов было в ИТМО в 2023 году?" + OPTIONS) is None
+
+
+def test_different_options_miss():
+    assert make_cache().get("Сколько студентов в ИТМО?\n1. 500\n2. 1500\n3. 3000\n4. 7000") is None
+
+
+class FakeIndex:
+    """Локальный индекс на 1000 фрагментов: «студент» и «итм» частые, «иностра» — редкое."""
+
+    n_docs = 1000
+    terms = {"итм": [400, 0], "студент": [300, 0], "учат": [200, 0], "иностра": [3, 0]}
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+
+def test_low_idf_difference_hits(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "LOCAL_INDEX_ENABLED", True)
+    monkeypatch.setattr(semantic_cache, "get_local_index", FakeIndex)
+    cache = SemanticCache(capacity=16, dim=1024)
+    cache.set("Сколько иностранных студентов в ИТМО?" + OPTIONS, RESULT)
+    assert cache.get("Сколько иностранных студентов учатся в ИТМО?" + OPTIONS) == RESULT
+
+
+def test_rare_word_difference_misses(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "LOCAL_INDEX_ENABLED", True)
+    monkeypatch.setattr(semantic_cache, "get_local_index", FakeIndex)
+    cache = SemanticCache(capacity=16, dim=1024)
+    cache.set("Сколько студентов учатся в ИТМО?" + OPTIONS, RESULT)
+    assert cache.get("Сколько иностранных студентов учатся в ИТМО?" + OPTIONS) is None
+
+
+def test_threshold_decides():
+    cache = SemanticCache(capacity=16, dim=1024, threshold=0.99)
+    cache.set("Сколько кампусов у ИТМО?" + OPTIONS, RESULT)
+    assert cache.get("Какое количество кампусов имеет университет ИТМО?" + OPTIONS) is None
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from search_itmo import pipeline, services
+from search_itmo.deadline import start_request
+from search_itmo.http_client import close_http_client
+
+LINKS = [f"https://site{i}.example/page" for i in range(8)]
+# Пустой текст — страница не загрузилась (или вернула пустое тело)
+TEXTS = {LINKS[0]: "", LINKS[1]: "Текст страницы 1 про ИТМО. " * 50, LINKS[2]: "", LINKS[3]: "Текст страницы 3 про ИТМО. " * 50}
+
+
+async def fake_fetch(session, link: str) -> str:
+    await asyncio.sleep(0.01)
+    return TEXTS.get(link, "Текст другой страницы про ИТМО. " * 50)
+
+
+async def fake_search(query: str):
+    return list(LINKS)
+
+
+@pytest.mark.parametrize("pipelined", [True, False])
+def test_sources_are_pages_used_in_context(monkeypatch, pipelined):
+    monkeypatch.setattr(services, "fetch_page_content", fake_fetch)
+    monkeypatch.setattr(pipeline, "search_links", fake_search)
+    monkeypatch.setattr(pipeline, "COMPRESS_PIPELINED", pipelined)
+
+    async def run():
+        start_request(30)
+        try:
+            return await pipeline.retrieve_context("Сколько кампусов у ИТМО?")
+        finally:
+            await close_http_client()
+
+    sources, context = asyncio.run(run())
+    assert sources == [LINKS[1], LINKS[3], LINKS[4]]
+    assert context
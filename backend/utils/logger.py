@@ -1,34 +1,238 @@
+import asyncio
+import fcntl
+import json
+import os
+import random
 import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
 
-from aiologger import Logger
-from aiologger.formatters.base import Formatter
-from aiologger.handlers.files import AsyncFileHandler
-from aiologger.handlers.streams import AsyncStreamHandler
-from aiologger.levels import LogLevel
-
-
-async def setup_logger():
-    # Create logger instance
-    logger = Logger(name="api_logger")
-
-    # Create formatter
-    formatter = Formatter(
-        fmt="{asctime} | {levelname} | {message}",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        style="{",
-    )
-
-    file_handler = AsyncFileHandler(
-        filename="logs/api.log",
-        mode="a",
-        encoding="utf-8",
-    )
-    stream_handler = AsyncStreamHandler(stream=sys.stdout)
-    file_handler.formatter = formatter
-    stream_handler.formatter = formatter
-    logger.add_handler(file_handler)
-    logger.add_handler(stream_handler)
-
-    logger.level = LogLevel.INFO
-
-    return logger
+from search_itmo.config import (
+    ACCESS_LOG_PATH,
+    ACCESS_LOG_STDOUT,
+    ACCESS_LOG_BODY_SAMPLE,
+    ACCESS_LOG_BODY_MAX_BYTES,
+    ACCESS_LOG_MAX_BYTES,
+    ACCESS_LOG_BACKUPS,
+    ACCESS_LOG_QUEUE_SIZE,
+    ACCESS_LOG_BATCH_SIZE,
+    ACCESS_LOG_FLUSH_INTERVAL,
+)
+
+
+class AccessLogWriter:
+    """
+    Пишет JSON-строки журнала пачками в фоне: запрос только кладёт запись в
+    очередь, а запись в файл и stdout идёт в пуле потоков раз в flush_interval
+    секунд или по набору batch_size записей. Если очередь переполнена, запись
+    отбрасывается (счётчик dropped), а не задерживает ответ.
+
+    Файл общий для всех воркеров: каждая пачка пишется одним write() под flock,
+    при превышении max_bytes файл переименовывается в .1, .2, ... (backups штук),
+    а остальные воркеры замечают смену inode и открывают новый файл.
+    """
+
+    def __init__(
+        self,
+        path: str = ACCESS_LOG_PATH,
+        stdout: bool = ACCESS_LOG_STDOUT,
+        max_bytes: int = ACCESS_LOG_MAX_BYTES,
+        backups: int = ACCESS_LOG_BACKUPS,
+        queue_size: int = ACCESS_LOG_QUEUE_SIZE,
+        batch_size: int = ACCESS_LOG_BATCH_SIZE,
+        flush_interval: float = ACCESS_LOG_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.stdout = stdout
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fd: Optional[int] = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает то, что осталось в очереди, и закрывает файл."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def log(self, record: dict) -> None:
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(json.dumps(record, ensure_ascii=False))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        # None в очереди — сигнал остановки от stop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if self.dropped:
+                batch.append(json.dumps({"event": "access_log_dropped", "count": self.dropped}))
+                self.dropped = 0
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except OSError as e:
+                print(f"Access log write error: {e}", file=sys.stderr)
+
+    # Методы ниже выполняются в пуле потоков
+
+    def _open(self) -> int:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _reopen_if_rotated(self) -> None:
+        try:
+            stale = self._fd is not None and os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            stale = True
+        if stale:
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            self._fd = self._open()
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.truncate(self.path, 0)
+
+    def _write(self, batch: List[str]) -> None:
+        data = ("\n".join(batch) + "\n").encode("utf-8")
+        if self.stdout:
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+        if not self.path:
+            return
+        self._reopen_if_rotated()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # Пока ждали блокировку, файл мог ротировать другой воркер
+            if os.stat(self.path).st_ino != os.fstat(self._fd).st_ino:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._reopen_if_rotated()
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            size = os.fstat(self._fd).st_size
+            if self.max_bytes and size and size + len(data) > self.max_bytes:
+                self._rotate()
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._reopen_if_rotated()
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            os.write(self._fd, data)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def _body_sample(chunks: List[bytes]) -> str:
+    body = b"".join(chunks)[:ACCESS_LOG_BODY_MAX_BYTES]
+    return body.decode("utf-8", errors="replace")
+
+
+class AccessLogMiddleware:
+    """
+    ASGI-слой журнала доступа. Ничего не буферизует и не пересобирает ответ:
+    считает байты запроса и ответа на лету, а для доли ACCESS_LOG_BODY_SAMPLE
+    запросов сохраняет первые ACCESS_LOG_BODY_MAX_BYTES байт тел.
+    Стриминговые ответы проходят насквозь без задержки.
+    """
+
+    def __init__(self, app, writer: "AccessLogWriter"):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sampled = ACCESS_LOG_BODY_SAMPLE > 0 and random.random() < ACCESS_LOG_BODY_SAMPLE
+        state = {"status": 500, "request_bytes": 0, "response_bytes": 0}
+        request_body: List[bytes] = []
+        response_body: List[bytes] = []
+
+        def capture(chunks: List[bytes], data: bytes, captured: int) -> None:
+            if sampled and captured < ACCESS_LOG_BODY_MAX_BYTES:
+                chunks.append(data[:ACCESS_LOG_BODY_MAX_BYTES - captured])
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                capture(request_body, body, state["request_bytes"])
+                state["request_bytes"] += len(body)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                capture(response_body, body, state["response_bytes"])
+                state["response_bytes"] += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            client = scope.get("client")
+            record = {
+                "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": state["status"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "request_bytes": state["request_bytes"],
+                "response_bytes": state["response_bytes"],
+                "client": client[0] if client else None,
+                "pid": os.getpid(),
+            }
+            if sampled:
+                record["request_body"] = _body_sample(request_body)
+                record["response_body"] = _body_sample(response_body)
+            self.writer.log(record)
+
+
+access_log = AccessLogWriter()
@@ -34,7 +34,7 @@ function App() {
     try {
       const response = await fetch(`${API_BASE_URL}/api/request`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'X-Priority': 'interactive' },
         body: JSON.stringify({ query: inputValue, id: requestId })
       });
       setRequestId(prev => prev + 1);